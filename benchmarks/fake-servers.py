@@ -0,0 +1,556 @@
+#!/usr/bin/env python
+
+# A local stand-in for bugs.llvm.org, llvm.org, github.com and api.github.com,
+# so that the scripts in this repo can be tried out (and their concurrency
+# tuned) without waiting on the real servers, running into their rate limits,
+# or, in json-to-github.py's case, doing anything irreversible.
+#
+#     benchmarks/fake-servers.py &
+#     export BUGZILLA_URL=http://127.0.0.1:8770
+#     export GITHUB_URL=http://127.0.0.1:8770 GITHUB_API_URL=http://127.0.0.1:8770
+#     export LLVM_ORG_URL=http://127.0.0.1:8770 GITHUB_API_TOKEN=fake
+#     ./bugzilla-to-xml.py
+#
+# It serves a synthetic Bugzilla of NUMBER_OF_BUGS bugs, generated from
+# RANDOM_SEED, so every run sees the same corpus: every MISSING_BUG_EVERY'th
+# bug number "never became a bug" and comes back as <bug error="NotFound">.
+#     GET  /show_bug.cgi?id=1&id=2&...&ctype=xml[&excludefield=attachmentdata]
+#     GET  /buglist.cgi?...&ctype=csv (by bug_id range, or by chfieldfrom)
+#     GET  /attachment.cgi?id=N
+#
+# And a single GitHub repository (whatever its name), which starts out with
+# the first SEEDED_ISSUES bugs already migrated, and grows as you import more.
+#     GET  /repos/:owner/:repo/issues?state=...&sort=...&direction=...&since=...&page=...&per_page=...
+#     GET  /repos/:owner/:repo/issues/N
+#     GET  /repos/:owner/:repo/issues/N/comments?page=...&per_page=...
+#     POST /repos/:owner/:repo/issues/N/labels
+#     POST /repos/:owner/:repo/import/issues
+#     GET  /repos/:owner/:repo/import/issues?since=...
+#     GET  /repos/:owner/:repo/import/issues/ID
+# plus the redirect chain that bz-map-to-gh-map.py follows:
+#     GET  /PRnnn -> /llvm/llvm-bugzilla-archive/issues/nnn -> /llvm/llvm-project/issues/N
+#
+# Every response is delayed by LATENCY_SECONDS; a SERVER_ERROR_RATE fraction of
+# requests fail with a 502 (and half of those failed POSTs took effect anyway,
+# as can happen for real). The /repos endpoints also enforce GitHub's primary
+# rate limit (with the usual X-RateLimit-* headers) and its secondary rate
+# limits on concurrent requests and on content creation, answering 403 with a
+# Retry-After. The defaults are GitHub's documented limits; shrink them to see
+# how the scripts cope without having to wait an hour. Like GitHub, they send
+# an ETag with every 200 to a GET, and answer a matching If-None-Match with a
+# 304, which doesn't count against the primary rate limit.
+#
+# Everything is kept in memory; restart the server to start over.
+# Press Ctrl-C to stop it and print how many requests each endpoint got.
+
+import base64
+import collections
+import datetime
+import hashlib
+import http.server
+import json
+import random
+import re
+import threading
+import time
+import urllib.parse
+
+FAKE_SERVER_PORT = 8770
+RANDOM_SEED = 1
+NUMBER_OF_BUGS = 2000
+MISSING_BUG_EVERY = 37
+SEEDED_ISSUES = 500
+
+LATENCY_SECONDS = (0.05, 0.25)
+SERVER_ERROR_RATE = 0.01
+PRIMARY_RATE_LIMIT = 5000
+PRIMARY_RATE_LIMIT_WINDOW_SECONDS = 3600
+SECONDARY_MAX_CONCURRENT_REQUESTS = 100
+SECONDARY_MAX_CONTENT_CREATION_PER_MINUTE = 80
+SECONDARY_RETRY_AFTER_SECONDS = 60
+IMPORT_SECONDS = 2.0
+
+BUGZILLA_HEADER = b'''<?xml version="1.0" encoding="UTF-8" standalone="yes" ?>
+<!DOCTYPE bugzilla SYSTEM "https://bugs.llvm.org/page.cgi?id=bugzilla.dtd">
+
+<bugzilla version="5.0.4"
+          urlbase="https://bugs.llvm.org/"
+          maintainer="bugs-admin@lists.llvm.org"
+          exporter="someone@example.com"
+>
+'''
+
+NOT_FOUND_XML = '''
+    <bug error="NotFound">
+          <bug_id>%d</bug_id>
+    </bug>
+'''
+
+PRODUCTS = [('clang', 'C++'), ('clang', 'Frontend'), ('libc++', 'All Bugs'), ('new-bugs', 'new bugs'), ('lld', 'ELF')]
+STATUSES = [('NEW', ''), ('CONFIRMED', ''), ('RESOLVED', 'FIXED'), ('RESOLVED', 'INVALID'), ('RESOLVED', 'DUPLICATE')]
+WORDS = ['crash', 'miscompile', 'template', 'assertion', 'optimizer', 'linker', 'warning', 'regression', 'std::vector', '<foo>']
+
+
+def xml_escape(s):
+    return s.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+
+def bugzilla_time(t):
+    return time.strftime('%Y-%m-%d %H:%M:%S -0000', time.gmtime(t))
+
+
+def github_time(t):
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(t))
+
+
+class SyntheticBug:
+    def __init__(self, id):
+        rng = random.Random(RANDOM_SEED * 1000003 + id)
+        self.id = id
+        self.exists = (id % MISSING_BUG_EVERY != 0)
+        self.created = 1100000000 + id * 20000 + rng.randrange(20000)
+        self.title = 'Synthetic bug %d: %s' % (id, ' '.join(rng.choice(WORDS) for _ in range(rng.randrange(2, 6))))
+        self.product, self.component = rng.choice(PRODUCTS)
+        self.status, self.resolution = rng.choice(STATUSES)
+        self.dup_id = None
+        if self.resolution == 'DUPLICATE':
+            self.dup_id = rng.randrange(1, NUMBER_OF_BUGS + 1)
+        self.comments = []
+        self.attachments = []
+        t = self.created
+        for i in range(rng.randrange(0, 12)):
+            t += rng.randrange(60, 2000000)
+            if rng.random() < 0.2:
+                attachid = id * 100 + i
+                data = rng.randbytes(rng.randrange(100, 5000))
+                self.attachments.append((attachid, t, data))
+                self.comments.append((t, 'Created attachment %d\ntestcase' % attachid))
+            else:
+                self.comments.append((t, 'See PR%d and r%d. %s' % (
+                    rng.randrange(1, NUMBER_OF_BUGS), rng.randrange(100000, 300000),
+                    ' '.join(rng.choice(WORDS) for _ in range(rng.randrange(1, 80))),
+                )))
+        self.changed = t
+
+    def to_xml(self, include_attachment_data):
+        if not self.exists:
+            return NOT_FOUND_XML % self.id
+        parts = ['''
+    <bug>
+          <bug_id>%d</bug_id>
+          <creation_ts>%s</creation_ts>
+          <short_desc>%s</short_desc>
+          <delta_ts>%s</delta_ts>
+          <reporter_accessible>1</reporter_accessible>
+          <cclist_accessible>1</cclist_accessible>
+          <classification_id>1</classification_id>
+          <classification>Unclassified</classification>
+          <product>%s</product>
+          <component>%s</component>
+          <version>trunk</version>
+          <rep_platform>PC</rep_platform>
+          <op_sys>Linux</op_sys>
+          <bug_status>%s</bug_status>
+          <resolution>%s</resolution>%s
+          <keywords></keywords>
+          <priority>P</priority>
+          <bug_severity>normal</bug_severity>
+          <target_milestone>---</target_milestone>
+          <everconfirmed>%d</everconfirmed>
+          <reporter name="Some One">someone@example.com</reporter>
+          <assigned_to name="Unassigned">unassigned@example.com</assigned_to>
+          <cf_fixed_by_commits></cf_fixed_by_commits>''' % (
+            self.id, bugzilla_time(self.created), xml_escape(self.title), bugzilla_time(self.changed),
+            self.product, self.component, self.status, self.resolution,
+            ('\n          <dup_id>%d</dup_id>' % self.dup_id) if self.dup_id else '', (self.status != 'NEW'),
+        )]
+        for i, (t, text) in enumerate([(self.created, 'This is the description of bug %d.' % self.id)] + self.comments):
+            parts.append('''
+          <long_desc isprivate="0" >
+            <commentid>%d</commentid>
+            <comment_count>%d</comment_count>
+            <who name="Some One">someone@example.com</who>
+            <bug_when>%s</bug_when>
+            <thetext>%s</thetext>
+          </long_desc>''' % (self.id * 100 + i, i, bugzilla_time(t), xml_escape(text)))
+        for attachid, t, data in self.attachments:
+            parts.append('''
+          <attachment isobsolete="0" ispatch="0" isprivate="0" >
+            <attachid>%d</attachid>
+            <date>%s</date>
+            <delta_ts>%s</delta_ts>
+            <desc>testcase</desc>
+            <filename>test%d.cpp</filename>
+            <type>text/plain</type>
+            <size>%d</size>
+            <attacher name="Some One">someone@example.com</attacher>%s
+          </attachment>''' % (
+                attachid, bugzilla_time(t), bugzilla_time(t), attachid, len(data),
+                ('\n            <data encoding="base64">%s</data>' % base64.encodebytes(data).decode()) if include_attachment_data else '',
+            ))
+        parts.append('\n    </bug>\n')
+        return ''.join(parts)
+
+
+def all_synthetic_bugs():
+    return {id: SyntheticBug(id) for id in range(1, NUMBER_OF_BUGS + 1)}
+
+
+def github_user(login):
+    user = {'login': login, 'id': 1, 'node_id': 'MDQ6VXNlcjE=', 'gravatar_id': '', 'type': 'User', 'site_admin': False}
+    for key in ['avatar_url', 'url', 'html_url', 'followers_url', 'following_url', 'gists_url', 'starred_url',
+                'subscriptions_url', 'organizations_url', 'repos_url', 'events_url', 'received_events_url']:
+        user[key] = 'https://example.com/%s/%s' % (login, key)
+    return user
+
+
+class Repository:
+    # What GitHub would tell us about one repository. All methods are called with `lock` held.
+    def __init__(self, bugs):
+        self.issues = []      # issue number N is self.issues[N-1]
+        self.comments = {}    # issue number -> list of comments
+        self.imports = []     # import id N is self.imports[N-1]
+        self.bz_to_gh = {}
+        for bug in [b for b in bugs.values() if b.exists][:SEEDED_ISSUES]:
+            self.create_issue({
+                'issue': {
+                    'title': bug.title,
+                    'body': '| Bugzilla Link | [PR%d](https://bugs.llvm.org/show_bug.cgi?id=%d) |\n\nMigrated.' % (bug.id, bug.id),
+                    'created_at': github_time(bug.created),
+                    'updated_at': github_time(bug.changed),
+                    'closed': (bug.status == 'RESOLVED'),
+                    'labels': [bug.product],
+                },
+                'comments': [{'created_at': github_time(t), 'body': text} for t, text in bug.comments],
+            })
+
+    def create_issue(self, payload):
+        number = len(self.issues) + 1
+        issue = payload['issue']
+        self.issues.append({
+            'url': 'https://example.com/issues/%d' % number,
+            'repository_url': 'https://example.com/repo',
+            'labels_url': 'https://example.com/issues/%d/labels{/name}' % number,
+            'comments_url': 'https://example.com/issues/%d/comments' % number,
+            'events_url': 'https://example.com/issues/%d/events' % number,
+            'html_url': 'https://example.com/issues/%d' % number,
+            'timeline_url': 'https://example.com/issues/%d/timeline' % number,
+            'id': 1000000 + number,
+            'node_id': 'I_fake%d' % number,
+            'number': number,
+            'title': issue['title'],
+            'user': github_user('importer'),
+            'labels': [],
+            'state': 'closed' if issue.get('closed') else 'open',
+            'locked': False,
+            'assignee': None,
+            'assignees': [],
+            'comments': len(payload.get('comments', [])),
+            'created_at': issue.get('created_at', github_time(time.time())),
+            'updated_at': issue.get('updated_at', github_time(time.time())),
+            'closed_at': issue.get('closed_at') if issue.get('closed') else None,
+            'body': issue['body'],
+            'reactions': {'url': 'https://example.com/reactions', 'total_count': 0, '+1': 0},
+            'performed_via_github_app': None,
+        })
+        self.add_labels(number, issue.get('labels', []))
+        self.comments[number] = [{
+            'url': 'https://example.com/comments/%d' % i,
+            'html_url': 'https://example.com/comments/%d' % i,
+            'issue_url': 'https://example.com/issues/%d' % number,
+            'id': number * 1000 + i,
+            'user': github_user('importer'),
+            'created_at': c['created_at'],
+            'updated_at': c['created_at'],
+            'body': c['body'],
+            'reactions': {'url': 'https://example.com/reactions', 'total_count': 0, '+1': 0},
+            'performed_via_github_app': None,
+        } for i, c in enumerate(payload.get('comments', []))]
+        m = re.search(r'show_bug\.cgi\?id=([0-9]+)', issue['body'])
+        if m and int(m.group(1)) not in self.bz_to_gh:
+            self.bz_to_gh[int(m.group(1))] = number
+        return number
+
+    def add_labels(self, number, names):
+        labels = self.issues[number - 1]['labels']
+        for name in names:
+            if name not in [label['name'] for label in labels]:
+                labels.append({'id': len(labels) + 1, 'url': 'https://example.com/labels/%s' % name, 'name': name, 'color': 'ededed', 'default': False, 'description': None})
+        return labels
+
+    def start_import(self, payload, now):
+        self.imports.append({'payload': payload, 'created_at': now, 'issue_number': None})
+        return self.import_status(len(self.imports))
+
+    def import_status(self, import_id):
+        imp = self.imports[import_id - 1]
+        # Imports finish in the order they arrived, so the issues are numbered in that order too.
+        if (imp['issue_number'] is None) and (time.time() >= imp['created_at'] + IMPORT_SECONDS):
+            for earlier in self.imports[:import_id]:
+                if earlier['issue_number'] is None:
+                    earlier['issue_number'] = self.create_issue(earlier['payload'])
+        status = {
+            'id': import_id,
+            'status': 'pending' if (imp['issue_number'] is None) else 'imported',
+            'url': '/import/issues/%d' % import_id,
+            'import_issues_url': '/import/issues',
+            'created_at': github_time(imp['created_at']),
+            'updated_at': github_time(imp['created_at']),
+        }
+        if imp['issue_number'] is not None:
+            status['issue_url'] = '/issues/%d' % imp['issue_number']
+        return status
+
+
+class RateLimits:
+    # All methods are called with `lock` held.
+    def __init__(self):
+        self.window_start = time.time()
+        self.used = 0
+        self.in_flight = 0
+        self.content_created = collections.deque()
+        self.blocked_until = 0.0
+
+    def primary_headers(self):
+        return {
+            'X-RateLimit-Limit': str(PRIMARY_RATE_LIMIT),
+            'X-RateLimit-Remaining': str(max(0, PRIMARY_RATE_LIMIT - self.used)),
+            'X-RateLimit-Reset': str(int(self.window_start + PRIMARY_RATE_LIMIT_WINDOW_SECONDS)),
+        }
+
+    def admit(self, creates_content):
+        # Returns None if the request may go ahead, or the (status, body, headers) to refuse it with.
+        now = time.time()
+        if now >= self.window_start + PRIMARY_RATE_LIMIT_WINDOW_SECONDS:
+            self.window_start = now
+            self.used = 0
+        if self.used >= PRIMARY_RATE_LIMIT:
+            return 403, {'message': 'API rate limit exceeded for user.'}, self.primary_headers()
+        self.used += 1
+        while self.content_created and self.content_created[0] < now - 60:
+            self.content_created.popleft()
+        if (now < self.blocked_until) or (self.in_flight >= SECONDARY_MAX_CONCURRENT_REQUESTS) or (
+            creates_content and len(self.content_created) >= SECONDARY_MAX_CONTENT_CREATION_PER_MINUTE
+        ):
+            self.blocked_until = max(self.blocked_until, now + SECONDARY_RETRY_AFTER_SECONDS)
+            headers = dict(self.primary_headers(), **{'Retry-After': str(SECONDARY_RETRY_AFTER_SECONDS)})
+            return 403, {'message': 'You have exceeded a secondary rate limit. Please wait a few minutes before you try again.'}, headers
+        if creates_content:
+            self.content_created.append(now)
+        self.in_flight += 1
+        return None
+
+
+lock = threading.Lock()
+rng = random.Random(RANDOM_SEED)
+bugs = all_synthetic_bugs()
+attachments = {attachid: data for bug in bugs.values() for attachid, _, data in bug.attachments}
+repository = Repository(bugs)
+rate_limits = RateLimits()
+request_counts = collections.Counter()
+
+
+class FakeServerHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.handle_request('GET')
+
+    def do_POST(self):
+        self.handle_request('POST')
+
+    def handle_request(self, method):
+        url = urllib.parse.urlsplit(self.path)
+        query = urllib.parse.parse_qs(url.query)
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        route, handler = self.route(method, url.path)
+        is_github_api = url.path.startswith('/repos/')
+        with lock:
+            delay = rng.uniform(*LATENCY_SECONDS)
+            server_error = (rng.random() < SERVER_ERROR_RATE)
+            act_anyway = (rng.random() < 0.5)
+            refusal = rate_limits.admit(method == 'POST') if is_github_api else None
+        time.sleep(delay)
+        if refusal is not None:
+            status, payload, headers = refusal
+        else:
+            try:
+                if server_error and not (method == 'POST' and act_anyway):
+                    status, payload, headers = 502, {'message': 'Server Error'}, {}
+                else:
+                    with lock:
+                        status, payload, headers = handler(query, body, *re.fullmatch(route, url.path).groups())
+                    if server_error:
+                        status, payload, headers = 502, {'message': 'Server Error'}, {}
+            finally:
+                if is_github_api:
+                    with lock:
+                        rate_limits.in_flight -= 1
+            if is_github_api:
+                with lock:
+                    if (method == 'GET') and (status == 200):
+                        etag = '"%s"' % hashlib.sha1(json.dumps(payload).encode('utf-8')).hexdigest()
+                        headers = dict(headers, ETag=etag)
+                        if self.headers.get('If-None-Match') == etag:
+                            status, payload = 304, ''
+                            rate_limits.used -= 1
+                    headers = dict(rate_limits.primary_headers(), **headers)
+        with lock:
+            request_counts[method, route, status] += 1
+        self.send(status, payload, headers)
+
+    def send(self, status, payload, headers):
+        if isinstance(payload, bytes):
+            data = payload
+            content_type = 'application/octet-stream'
+        elif isinstance(payload, str):
+            data = payload.encode('utf-8')
+            content_type = 'text/plain; charset=utf-8'
+        else:
+            data = json.dumps(payload).encode('utf-8')
+            content_type = 'application/json; charset=utf-8'
+        self.send_response(status)
+        self.send_header('Content-Type', headers.pop('Content-Type', content_type))
+        self.send_header('Content-Length', str(len(data)))
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def base_url(self):
+        return 'http://%s' % self.headers.get('Host', '127.0.0.1:%d' % FAKE_SERVER_PORT)
+
+    def route(self, method, path):
+        routes = [
+            ('GET', r'/show_bug\.cgi', self.show_bug),
+            ('GET', r'/buglist\.cgi', self.buglist),
+            ('GET', r'/attachment\.cgi', self.attachment),
+            ('GET', r'/PR([0-9]+)', self.llvm_org_redirect),
+            ('GET', r'/llvm/llvm-bugzilla-archive/issues/([0-9]+)', self.archive_redirect),
+            ('GET', r'/repos/[^/]+/[^/]+/issues', self.list_issues),
+            ('GET', r'/repos/[^/]+/[^/]+/issues/([0-9]+)', self.get_issue),
+            ('GET', r'/repos/[^/]+/[^/]+/issues/([0-9]+)/comments', self.list_comments),
+            ('POST', r'/repos/[^/]+/[^/]+/issues/([0-9]+)/labels', self.add_labels),
+            ('POST', r'/repos/[^/]+/[^/]+/import/issues', self.start_import),
+            ('GET', r'/repos/[^/]+/[^/]+/import/issues', self.list_imports),
+            ('GET', r'/repos/[^/]+/[^/]+/import/issues/([0-9]+)', self.get_import),
+        ]
+        for route_method, route, handler in routes:
+            if (route_method == method) and re.fullmatch(route, path):
+                return route, handler
+        return path, self.not_found
+
+    def not_found(self, query, body, *args):
+        return 404, {'message': 'Not Found'}, {}
+
+    def show_bug(self, query, body):
+        include_attachment_data = ('attachmentdata' not in query.get('excludefield', []))
+        parts = [BUGZILLA_HEADER.decode()]
+        for id in [int(id) for id in query.get('id', [])]:
+            parts.append(bugs[id].to_xml(include_attachment_data) if (id in bugs) else (NOT_FOUND_XML % id))
+        parts.append('\n</bugzilla>\n')
+        return 200, ''.join(parts), {'Content-Type': 'text/xml; charset=UTF-8'}
+
+    def buglist(self, query, body):
+        first, last = 1, NUMBER_OF_BUGS
+        if query.get('f1') == ['bug_id']:
+            first, last = int(query['v1'][0]), int(query['v2'][0])
+        since = 0
+        if 'chfieldfrom' in query:
+            since = datetime.datetime.strptime(query['chfieldfrom'][0], '%Y-%m-%d').replace(tzinfo=datetime.timezone.utc).timestamp()
+        rows = ['bug_id,changeddate'] + [
+            '%d,"%s"' % (bug.id, bugzilla_time(bug.changed))
+            for bug in bugs.values() if bug.exists and (first <= bug.id <= last) and (bug.changed >= since)
+        ]
+        return 200, '\n'.join(rows) + '\n', {'Content-Type': 'text/csv; charset=UTF-8'}
+
+    def attachment(self, query, body):
+        attachid = int(query.get('id', ['0'])[0])
+        if attachid not in attachments:
+            return 404, 'Attachment #%d does not exist.' % attachid, {}
+        return 200, attachments[attachid], {}
+
+    def llvm_org_redirect(self, query, body, bz_id):
+        return 301, '', {'Location': '%s/llvm/llvm-bugzilla-archive/issues/%s' % (self.base_url(), bz_id)}
+
+    def archive_redirect(self, query, body, bz_id):
+        if int(bz_id) not in repository.bz_to_gh:
+            return 404, 'Not Found', {}
+        return 302, '', {'Location': '%s/llvm/llvm-project/issues/%d' % (self.base_url(), repository.bz_to_gh[int(bz_id)])}
+
+    def page(self, query, items):
+        page = int(query.get('page', ['1'])[0])
+        per_page = min(100, int(query.get('per_page', ['30'])[0]))
+        return items[(page - 1) * per_page:page * per_page]
+
+    def list_issues(self, query, body):
+        state = query.get('state', ['open'])[0]
+        sort = query.get('sort', ['created'])[0]
+        since = query.get('since', ['1970-01-01T00:00:00Z'])[0]
+        issues = [i for i in repository.issues if (state in ['all', i['state']]) and (i['updated_at'] >= since)]
+        issues.sort(key=lambda i: (i[sort + '_at'], i['number']), reverse=(query.get('direction', ['desc'])[0] == 'desc'))
+        return 200, self.page(query, issues), {}
+
+    def get_issue(self, query, body, number):
+        if not (1 <= int(number) <= len(repository.issues)):
+            return 404, {'message': 'Not Found'}, {}
+        return 200, repository.issues[int(number) - 1], {}
+
+    def list_comments(self, query, body, number):
+        if int(number) not in repository.comments:
+            return 404, {'message': 'Not Found'}, {}
+        return 200, self.page(query, repository.comments[int(number)]), {}
+
+    def add_labels(self, query, body, number):
+        if not (1 <= int(number) <= len(repository.issues)):
+            return 404, {'message': 'Not Found'}, {}
+        labels = repository.add_labels(int(number), json.loads(body)['labels'])
+        repository.issues[int(number) - 1]['updated_at'] = github_time(time.time())
+        return 200, labels, {}
+
+    def start_import(self, query, body):
+        payload = json.loads(body)
+        if ('issue' not in payload) or (len(payload['issue'].get('body', '')) > 65536):
+            return 422, {'message': 'Validation Failed'}, {}
+        return 202, self.absolute(repository.start_import(payload, time.time())), {}
+
+    def list_imports(self, query, body):
+        since = query.get('since', ['1970-01-01T00:00:00Z'])[0]
+        statuses = [repository.import_status(i) for i in range(1, len(repository.imports) + 1)]
+        statuses = [s for s in statuses if s['created_at'] >= since]
+        page = int(query.get('page', ['1'])[0])
+        headers = {}
+        if self.page(dict(query, page=[str(page + 1)]), statuses):
+            next_query = dict(query, page=[str(page + 1)])
+            headers['Link'] = '<%s%s?%s>; rel="next"' % (self.base_url(), self.path.split('?')[0], urllib.parse.urlencode(next_query, doseq=True))
+        return 200, [self.absolute(s) for s in self.page(query, statuses)], headers
+
+    def get_import(self, query, body, import_id):
+        if not (1 <= int(import_id) <= len(repository.imports)):
+            return 404, {'message': 'Not Found'}, {}
+        return 200, self.absolute(repository.import_status(int(import_id))), {}
+
+    def absolute(self, status):
+        repo_url = self.base_url() + re.match(r'/repos/[^/]+/[^/]+', self.path).group(0)
+        status = dict(status)
+        for key in ['url', 'import_issues_url', 'issue_url']:
+            if key in status:
+                status[key] = repo_url + status[key]
+        status['repository_url'] = repo_url
+        return status
+
+
+if __name__ == '__main__':
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', FAKE_SERVER_PORT), FakeServerHandler)
+    server.daemon_threads = True
+    print('Serving %d synthetic bugs and %d issues on http://127.0.0.1:%d' % (len(bugs), len(repository.issues), FAKE_SERVER_PORT))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+    for (method, route, status), count in sorted(request_counts.items()):
+        print('%6d  %-4s %-50s HTTP %d' % (count, method, route, status))
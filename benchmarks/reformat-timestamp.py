@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+
+# Run this from the directory containing xml/ (i.e., after Step 1).
+# It collects every distinct Bugzilla timestamp in the corpus, checks that
+# xml-to-json.py's reformat_timestamp gives exactly the same answer for
+# each of them as reformat_timestamp_slowly (the original dateutil-based
+# implementation), and then times both, plus the cached fast path as it's
+# actually used (many comments sharing each timestamp).
+
+import glob
+import importlib
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+xml_to_json = importlib.import_module('xml-to-json')  # noqa: E402
+
+TIMESTAMP_RX = re.compile(rb'[0-9]{4}-[0-9]{2}-[0-9]{2} [0-9]{2}:[0-9]{2}:[0-9]{2} [+-][0-9]{2}00')
+
+
+def collect_timestamps():
+    # Every timestamp field, plus any timestamps quoted in comment text;
+    # the latter don't hurt, since they're in the same format.
+    occurrences = []
+    for fname in glob.glob('xml/*.xml'):
+        with open(fname, 'rb') as f:
+            occurrences += [m.decode() for m in TIMESTAMP_RX.findall(f.read())]
+    return occurrences
+
+
+def time_it(fn, timestamps):
+    start_time = time.perf_counter()
+    for t in timestamps:
+        fn(t)
+    return time.perf_counter() - start_time
+
+
+if __name__ == '__main__':
+    occurrences = collect_timestamps()
+    distinct = sorted(set(occurrences))
+    print('Found %d timestamps (%d distinct) in xml/' % (len(occurrences), len(distinct)))
+    assert distinct, 'No timestamps found; run this from the directory containing xml/'
+
+    mismatches = 0
+    for t in distinct:
+        expected = xml_to_json.reformat_timestamp_slowly(t)
+        actual = xml_to_json.reformat_timestamp.__wrapped__(t)
+        if actual != expected:
+            print('MISMATCH: %s => %s, but the slow path gives %s' % (t, actual, expected))
+            mismatches += 1
+    print('%d of %d distinct timestamps match the slow path' % (len(distinct) - mismatches, len(distinct)))
+
+    slow = time_it(xml_to_json.reformat_timestamp_slowly, occurrences)
+    fast = time_it(xml_to_json.reformat_timestamp.__wrapped__, occurrences)
+    xml_to_json.reformat_timestamp.cache_clear()
+    cached = time_it(xml_to_json.reformat_timestamp, occurrences)
+    print('slow path:           %8.3fs (%.2fus per call)' % (slow, 1e6 * slow / len(occurrences)))
+    print('fast path, uncached: %8.3fs (%.2fus per call)' % (fast, 1e6 * fast / len(occurrences)))
+    print('fast path, cached:   %8.3fs (%.2fus per call)' % (cached, 1e6 * cached / len(occurrences)))
+    print('cache: %s' % (xml_to_json.reformat_timestamp.cache_info(),))
+    sys.exit(1 if mismatches else 0)
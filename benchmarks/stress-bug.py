@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+
+# Generates synthetic bugs with thousands of comments and attachments,
+# and times xml-to-json.py's conversion of each one. Half the comments are
+# Bugzilla's "Created attachment NNN" comments, which the converter has to
+# replace with its own attachment comments. If the converter scales linearly,
+# the time per comment stays roughly constant as the bugs get bigger.
+#
+# For comparison, it also times (and checks the result against) the
+# straightforward quadratic way of merging attachments into the comments.
+
+import importlib
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import bzreader  # noqa: E402
+xml_to_json = importlib.import_module('xml-to-json')  # noqa: E402
+
+STRESS_SIZES = [250, 500, 1000, 2000, 4000]
+
+
+def generate_bug_xml(id, n):
+    comments = []
+    attachments = []
+    for i in range(n):
+        attachid = 100000 + i
+        when = '2015-%02d-%02d %02d:%02d:00 -0700' % (1 + (i // 1000) % 12, 1 + (i // 40) % 28, (i // 20) % 24, (3 * i) % 60)
+        comments.append('''
+          <long_desc isprivate="0" >
+            <commentid>%d</commentid>
+            <comment_count>%d</comment_count>
+            <who name="Some One">someone@example.com</who>
+            <bug_when>%s</bug_when>
+            <thetext>%s</thetext>
+          </long_desc>''' % (
+            1000000 + i, i + 1, when,
+            ('Created attachment %d\nreduced testcase' % attachid) if (i % 2 == 0) else
+            ('See PR%d, and attachment %d; r%d might have fixed it.' % (1000 + i, attachid - 1, 200000 + i)),
+        ))
+        if i % 2 == 0:
+            attachments.append('''
+          <attachment isobsolete="0" ispatch="0" isprivate="0" >
+            <attachid>%d</attachid>
+            <date>%s</date>
+            <delta_ts>%s</delta_ts>
+            <desc>testcase %d</desc>
+            <filename>test%d.cpp</filename>
+            <type>text/plain</type>
+            <size>%d</size>
+            <attacher name="Some One">someone@example.com</attacher>
+          </attachment>''' % (attachid, when, when, i, i, 100 + i))
+    return '''<?xml version="1.0" encoding="UTF-8" standalone="yes" ?>
+<!DOCTYPE bugzilla SYSTEM "https://bugs.llvm.org/page.cgi?id=bugzilla.dtd">
+
+<bugzilla version="5.0.4"
+          urlbase="https://bugs.llvm.org/"
+          maintainer="bugs-admin@lists.llvm.org"
+          exporter="someone@example.com"
+>
+
+    <bug>
+          <bug_id>%d</bug_id>
+          <creation_ts>2015-01-01 00:00:00 -0700</creation_ts>
+          <short_desc>Synthetic bug with %d comments</short_desc>
+          <delta_ts>2016-01-01 00:00:00 -0700</delta_ts>
+          <version>trunk</version>
+          <rep_platform>PC</rep_platform>
+          <op_sys>Linux</op_sys>
+          <bug_status>NEW</bug_status>
+          <resolution></resolution>
+          <keywords></keywords>
+          <priority>P</priority>
+          <bug_severity>normal</bug_severity>
+          <reporter name="Some One">someone@example.com</reporter>
+          <assigned_to name="Unassigned">unassigned@example.com</assigned_to>
+          <cc>someone@example.com</cc>
+          <cf_fixed_by_commits></cf_fixed_by_commits>
+          <long_desc isprivate="0" >
+            <commentid>999999</commentid>
+            <comment_count>0</comment_count>
+            <who name="Some One">someone@example.com</who>
+            <bug_when>2015-01-01 00:00:00 -0700</bug_when>
+            <thetext>This bug is very long.</thetext>
+          </long_desc>%s%s
+    </bug>
+
+</bugzilla>
+''' % (id, n, ''.join(comments), ''.join(attachments))
+
+
+def quadratic_merge(comments, attachments):
+    for a in attachments:
+        boring_body = 'Created attachment %s' % a['attachid']
+        attachment_comment = xml_to_json.to_github_attachment_comment(a)
+        comments = [
+            c for c in comments if boring_body not in c['body']
+        ] + [attachment_comment]
+    comments.sort(key=lambda c: c['updated_at'])
+    return comments
+
+
+if __name__ == '__main__':
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for n in STRESS_SIZES:
+            fname = os.path.join(tmpdir, '%d.xml' % n)
+            with open(fname, 'w') as f:
+                f.write(generate_bug_xml(n, n))
+
+            start_time = time.perf_counter()
+            bz = bzreader.parse(fname)
+            gh = xml_to_json.bugzilla_to_github(n, bz)
+            elapsed = time.perf_counter() - start_time
+
+            bug = bz['bugzilla']['bug']
+            comments = [xml_to_json.to_github_comment(c) for c in bzreader.repeated_element(bug, 'long_desc')[1:]]
+            attachments = bzreader.repeated_element(bug, 'attachment')
+            start_time = time.perf_counter()
+            expected = quadratic_merge(comments, attachments)
+            quadratic = time.perf_counter() - start_time
+            assert gh['comments'] == expected, 'Merged comments differ from the quadratic merge for n=%d' % n
+
+            print('%5d comments, %5d attachments: converted in %7.3fs (%6.1fus per comment); quadratic merge alone took %7.3fs' % (
+                n, len(attachments), elapsed, 1e6 * elapsed / n, quadratic,
+            ))
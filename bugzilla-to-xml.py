@@ -1,7 +1,20 @@
 #!/usr/bin/env python
 
+import concurrent.futures
+import csv
+import datetime
+import glob
+import hashlib
+import httpclient
+import io
+import json
 import os
-import requests
+import ratelimit
+import re
+import socket
+import sqlite3
+import tempfile
+import threading
 import time
 
 # This script works as-is, but without providing login credentials to Bugzilla
@@ -13,33 +26,503 @@ import time
 
 BUGZILLA_LOGIN = os.environ.get('BUGZILLA_LOGIN', None)
 BUGZILLA_LOGINCOOKIE = os.environ.get('BUGZILLA_LOGINCOOKIE', None)
-BUGZILLA_URL = 'https://bugs.llvm.org'
+# To rehearse against a local fake Bugzilla, see benchmarks/fake-servers.py.
+BUGZILLA_URL = os.environ.get('BUGZILLA_URL', 'https://bugs.llvm.org')
 FIRST_BUGZILLA_NUMBER = 1
 LAST_BUGZILLA_NUMBER = 53000
 
-if __name__ == '__main__':
+# How many requests to keep in flight at once. The worker threads share
+# one HttpClient and its pool of keep-alive connections, so we pay for the
+# TLS handshake only once per connection instead of once per bug. Set this to 1 to fetch serially.
+MAX_IN_FLIGHT_REQUESTS = 8
+
+# How many bugs to ask for in each request. show_bug.cgi accepts any number
+# of "id=" parameters and returns one <bugzilla> document containing all
+# of them; we split that document back apart into one file per bug.
+BUGS_PER_REQUEST = 20
+
+# By default, Bugzilla inlines every attachment into the XML as base64;
+# that's where most of the disk space in xml/ goes, and nothing downstream
+# of this script looks at it. Leave the attachment bodies out, and fetch
+# them separately with ./xml-to-attachments.py if you want them.
+EXCLUDE_ATTACHMENT_DATA = True
+
+# Every bug we finish writing into xml/ gets a line in this file, recording
+# its "delta_ts" (Bugzilla's last-modified time) and the size and SHA-256
+# of the file we wrote. On a restart we skip the bugs it lists, so an
+# interrupted Step 1 picks up where it left off.
+MANIFEST_FILENAME = 'xml-manifest.jsonl'
+
+# Set this to True for a nightly refresh: instead of walking the whole
+# (FIRST_BUGZILLA_NUMBER, LAST_BUGZILLA_NUMBER) range, ask Bugzilla which
+# bugs have changed since the newest "delta_ts" in the manifest, and
+# re-fetch only those.
+INCREMENTAL_SYNC = False
+
+# About 1400 of the numbers in LLVM's Bugzilla never became bugs. We route
+# those straight into invalid-xml/ as they arrive, but with this set to
+# True we first ask Bugzilla for the list of bugs that do exist (one cheap
+# buglist.cgi query), and never ask for the others at all.
+ENUMERATE_EXISTING_BUGS = False
+
+# To spread the work across several processes (on one host or several),
+# point them all at the same COORDINATOR_DATABASE, an SQLite file on a
+# filesystem they can all see. That filesystem must implement POSIX file
+# locks correctly. A local disk does; SQLite's documentation warns that
+# NFS often doesn't, and then two workers can claim the same chunk.
+# So for several hosts, use a cluster filesystem you trust with SQLite.
+# Each worker repeatedly claims the lowest unclaimed chunk of
+# BUGS_PER_CHUNK bug numbers, so nobody sits idle while others are stuck on
+# a slow range. A claim is a lease, renewed every third of
+# CHUNK_LEASE_SECONDS by a background thread; if a worker crashes, its chunk
+# becomes claimable again once the lease runs out. A worker that finds its
+# lease gone (because it stalled for longer than that) abandons the chunk.
+# Each worker records what it fetched in its own xml-manifest-<worker>.jsonl,
+# so that no two processes ever append to the same file.
+# Leave this as None to fetch the whole range in this process.
+COORDINATOR_DATABASE = None
+BUGS_PER_CHUNK = 200
+CHUNK_LEASE_SECONDS = 300
+
+# NamedTemporaryFile makes its files readable only by their owner; we give
+# ours the permissions that a plain open() would have.
+UMASK = os.umask(0)
+os.umask(UMASK)
+
+# A temporary file in xml/ that hasn't been touched for this long was left
+# behind by a run that was killed; a live one is finished within seconds.
+STALE_TEMPORARY_FILE_SECONDS = 3600
+
+# Shared by all the worker threads. It starts out gently, speeds up for
+# as long as Bugzilla keeps answering, and backs off (and retries) when
+# Bugzilla starts failing.
+rate_limiter = ratelimit.AdaptiveRateLimiter(requests_per_second=4)
+
+
+def make_client():
     assert (BUGZILLA_LOGIN is None) == (BUGZILLA_LOGINCOOKIE is None)
+    cookies = None
     if BUGZILLA_LOGIN is not None:
         cookies = {
             'Bugzilla_login': BUGZILLA_LOGIN,
             'Bugzilla_logincookie': BUGZILLA_LOGINCOOKIE,
         }
+    return httpclient.HttpClient(rate_limiter, cookies=cookies, max_connections_per_host=MAX_IN_FLIGHT_REQUESTS)
+
+
+def split_bugzilla_xml(chunks):
+    # Bugzilla escapes every '<' in text content, so a literal '<bug>',
+    # '<bug error="...">' or '</bug>' can only be a real tag. That lets
+    # us split the stream on those tags without parsing the XML.
+    # Yields ('start', header) at the start of each bug, where the header is
+    # everything before the first <bug> (i.e. the <bugzilla> element's start tag);
+    # then ('data', bytes) for successive pieces of the <bug> element;
+    # then ('end', None). No piece is ever much bigger than one chunk,
+    # so memory use doesn't depend on the size of the bug.
+    header = None
+    in_bug = False
+    buf = bytearray()
+    for chunk in chunks:
+        buf += chunk
+        while True:
+            if not in_bug:
+                m = re.search(rb'<bug[ >]', buf)
+                if m is None:
+                    if header is not None:
+                        # Between bugs there's nothing but whitespace (and eventually
+                        # </bugzilla>); keep just enough to spot a '<bug' split across chunks.
+                        del buf[:-4]
+                    break
+                if header is None:
+                    header = bytes(buf[:m.start()])
+                del buf[:m.start()]
+                in_bug = True
+                yield 'start', header
+            else:
+                end = buf.find(b'</bug>')
+                if end == -1:
+                    # Keep just enough to spot a '</bug>' split across chunks.
+                    n = len(buf) - len(b'</bug>') + 1
+                    if n > 0:
+                        yield 'data', bytes(buf[:n])
+                        del buf[:n]
+                    break
+                end += len(b'</bug>')
+                yield 'data', bytes(buf[:end])
+                del buf[:end]
+                in_bug = False
+                yield 'end', None
+    assert header is not None, 'Response contained no <bug> elements'
+    assert not in_bug, 'Response was truncated in the middle of a <bug>'
+
+
+class BugWriter:
+    # Streams one <bug> element, wrapped in the response's <bugzilla> start tag,
+    # into a temporary file, hashing it as it goes. finish() fsyncs the file
+    # and renames it into place, so xml/ never contains a truncated file,
+    # even if we're killed in the middle of writing one.
+    HEAD_SIZE = 65536
+
+    def __init__(self, header):
+        self.f = tempfile.NamedTemporaryFile(dir='xml', suffix='.tmp', delete=False)
+        os.fchmod(self.f.fileno(), 0o666 & ~UMASK)
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+        self.head = b''  # enough of the bug to find its <bug_id> and <delta_ts>
+        self.write_raw(header)
+
+    def write_raw(self, data):
+        self.f.write(data)
+        self.sha256.update(data)
+        self.size += len(data)
+
+    def write(self, data):
+        if len(self.head) < self.HEAD_SIZE:
+            self.head += data[:self.HEAD_SIZE - len(self.head)]
+        self.write_raw(data)
+
+    def finish(self):
+        self.write_raw(b'\n\n</bugzilla>\n')
+        self.f.flush()
+        os.fsync(self.f.fileno())
+        self.f.close()
+        id = extract_bug_id(self.head)
+        # A bug number that doesn't exist comes back as <bug error="NotFound">.
+        # Step 2 used to weed these out by hand; now we do it here.
+        directory = 'invalid-xml' if self.head.startswith(b'<bug error=') else 'xml'
+        os.replace(self.f.name, '%s/%d.xml' % (directory, id))
+        return {
+            'id': id,
+            'delta_ts': extract_delta_ts(self.head),
+            'sha256': self.sha256.hexdigest(),
+            'size': self.size,
+        }
+
+    def abort(self):
+        self.f.close()
+        os.remove(self.f.name)
+
+
+def remove_stale_temporary_files():
+    for fname in glob.glob('xml/*.tmp'):
+        try:
+            if os.path.getmtime(fname) < time.time() - STALE_TEMPORARY_FILE_SECONDS:
+                os.remove(fname)
+        except FileNotFoundError:
+            # Another worker got to it first.
+            pass
+
+
+def extract_bug_id(bug):
+    m = re.search(rb'<bug_id>([0-9]+)</bug_id>', bug)
+    assert m, 'Unexpected <bug> element without a <bug_id>: %r' % bug[:200]
+    return int(m.group(1))
+
+
+def extract_delta_ts(bug):
+    # The bug's own <delta_ts> comes before any <attachment>'s <delta_ts>.
+    # Nonexistent bugs don't have one at all.
+    m = re.search(rb'<delta_ts>([^<]*)</delta_ts>', bug)
+    return None if (m is None) else m.group(1).decode()
+
+
+def worker_manifest_filename(worker):
+    return 'xml-manifest-%s.jsonl' % re.sub(r'[^A-Za-z0-9_.-]', '_', worker)
+
+
+def load_manifest():
+    manifest = {}
+    for fname in [MANIFEST_FILENAME] + sorted(glob.glob('xml-manifest-*.jsonl')):
+        if os.path.exists(fname):
+            with open(fname) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # The last line may be truncated if we were killed while writing it.
+                        continue
+                    manifest[record['id']] = record
+    return manifest
+
+
+def already_fetched(id, manifest):
+    # Step 2 moves nonexistent bugs out of xml/ into invalid-xml/; that still counts.
+    return (id in manifest) and (
+        os.path.exists('xml/%d.xml' % id) or os.path.exists('invalid-xml/%d.xml' % id)
+    )
+
+
+def latest_delta_ts(manifest):
+    timestamps = [
+        datetime.datetime.strptime(record['delta_ts'], '%Y-%m-%d %H:%M:%S %z')
+        for record in manifest.values() if record['delta_ts'] is not None
+    ]
+    assert timestamps, 'The manifest is empty; do a full (non-incremental) sync first'
+    return max(timestamps)
+
+
+def query_bug_ids(client, query):
+    url = '%s/buglist.cgi?%s&query_format=advanced&ctype=csv&columns=changeddate&limit=0' % (BUGZILLA_URL, query)
+    r = client.get(url)
+    assert r.status_code == 200, 'Unexpected HTTP %d response: %s' % (r.status_code, r.text)
+    return sorted(int(row['bug_id']) for row in csv.DictReader(io.StringIO(r.text)))
+
+
+def query_changed_bug_ids(client, since):
+    # Bugzilla interprets "chfieldfrom" in its own local time zone, which
+    # we don't know. Back up by a day, so we can't miss anything; fetching
+    # a few bugs twice is cheap.
+    return query_bug_ids(client, 'chfieldfrom=%s&chfieldto=Now' % (
+        (since - datetime.timedelta(days=1)).strftime('%Y-%m-%d'),
+    ))
+
+
+def query_existing_bug_ids(client, first, last):
+    return query_bug_ids(client, 'f1=bug_id&o1=greaterthaneq&v1=%d&f2=bug_id&o2=lessthaneq&v2=%d' % (first, last))
+
+
+def fetch_bugs(client, ids):
+    url = '%s/show_bug.cgi?%s&ctype=xml' % (BUGZILLA_URL, '&'.join('id=%d' % id for id in ids))
+    if EXCLUDE_ATTACHMENT_DATA:
+        url += '&excludefield=attachmentdata'
+    records = []
+    writer = None
+    try:
+        with client.get(url, stream=True) as r:
+            assert r.status_code == 200, 'Unexpected HTTP %d response: %s' % (r.status_code, r.text)
+            for event, value in split_bugzilla_xml(r.iter_content(chunk_size=65536)):
+                if event == 'start':
+                    if BUGZILLA_LOGIN is not None:
+                        assert b'exporter=' in value, 'Are your Bugzilla login cookies expired or misspelled?'
+                    writer = BugWriter(value)
+                elif event == 'data':
+                    writer.write(value)
+                else:
+                    records.append(writer.finish())
+                    writer = None
+    finally:
+        if writer is not None:
+            writer.abort()
+    fetched_ids = [record['id'] for record in records]
+    assert sorted(fetched_ids) == sorted(ids), 'Asked for bugs %r but got %r' % (ids, fetched_ids)
+    return records
+
+
+class LeaseLost(Exception):
+    pass
+
+
+class WorkQueue:
+    def __init__(self, filename, worker):
+        self.filename = filename
+        self.worker = worker
+        self.renewer = None
+        self.db = sqlite3.connect(filename, timeout=60, isolation_level=None)
+        self.db.executescript('''
+            CREATE TABLE IF NOT EXISTS chunks (
+                first INTEGER PRIMARY KEY,
+                last INTEGER NOT NULL,
+                state TEXT NOT NULL,  -- 'pending', 'claimed', or 'done'
+                worker TEXT,
+                lease_expires REAL
+            );
+            CREATE TABLE IF NOT EXISTS workers (
+                worker TEXT PRIMARY KEY,
+                started_at REAL NOT NULL,
+                last_seen REAL NOT NULL,
+                chunks_done INTEGER NOT NULL,
+                bugs_fetched INTEGER NOT NULL
+            );
+        ''')
+        now = time.time()
+        self.db.execute(
+            'INSERT OR REPLACE INTO workers VALUES (?, ?, ?, 0, 0)',
+            (self.worker, now, now),
+        )
+
+    def populate(self, first, last, chunk_size):
+        # Every worker does this; only the first one to get here adds anything.
+        self.db.execute('BEGIN IMMEDIATE')
+        self.db.executemany(
+            "INSERT OR IGNORE INTO chunks VALUES (?, ?, 'pending', NULL, NULL)",
+            [(i, min(i + chunk_size - 1, last)) for i in range(first, last + 1, chunk_size)],
+        )
+        self.db.execute('COMMIT')
+
+    def claim(self):
+        # Returns (first, last, reclaimed), or None if there's nothing left to do.
+        # BEGIN IMMEDIATE takes the write lock up front, so two workers can't
+        # both see the same chunk as available.
+        now = time.time()
+        self.db.execute('BEGIN IMMEDIATE')
+        row = self.db.execute(
+            "SELECT first, last, state FROM chunks"
+            " WHERE state = 'pending' OR (state = 'claimed' AND lease_expires < ?)"
+            " ORDER BY first LIMIT 1",
+            (now,),
+        ).fetchone()
+        if row is not None:
+            self.db.execute(
+                "UPDATE chunks SET state = 'claimed', worker = ?, lease_expires = ? WHERE first = ?",
+                (self.worker, now + CHUNK_LEASE_SECONDS, row[0]),
+            )
+        self.db.execute('COMMIT')
+        return None if (row is None) else (row[0], row[1], row[2] == 'claimed')
+
+    def renew(self, db, first):
+        # Returns False if the chunk has been claimed by another worker.
+        now = time.time()
+        renewed = db.execute(
+            "UPDATE chunks SET lease_expires = ? WHERE first = ? AND worker = ? AND state = 'claimed'",
+            (now + CHUNK_LEASE_SECONDS, first, self.worker),
+        ).rowcount == 1
+        db.execute('UPDATE workers SET last_seen = ? WHERE worker = ?', (now, self.worker))
+        return renewed
+
+    def start_renewing(self, first):
+        # Renews the lease from a thread of its own (with its own connection),
+        # so that it doesn't lapse while the fetching threads wait on the rate limiter.
+        stopped = threading.Event()
+        lost = threading.Event()
+
+        def keep_renewing():
+            db = sqlite3.connect(self.filename, timeout=60, isolation_level=None)
+            while not stopped.wait(CHUNK_LEASE_SECONDS / 3):
+                if not self.renew(db, first):
+                    lost.set()
+                    break
+            db.close()
+
+        thread = threading.Thread(target=keep_renewing, daemon=True)
+        thread.start()
+        self.renewer = (first, stopped, lost, thread)
+
+    def stop_renewing(self):
+        _, stopped, _, thread = self.renewer
+        stopped.set()
+        thread.join()
+        self.renewer = None
+
+    def check_lease(self):
+        first, _, lost, _ = self.renewer
+        if lost.is_set():
+            raise LeaseLost(first)
+
+    def release(self, first):
+        self.db.execute(
+            "UPDATE chunks SET state = 'pending', worker = NULL, lease_expires = NULL WHERE first = ? AND worker = ?",
+            (first, self.worker),
+        )
+
+    def finish(self, first, bugs_fetched):
+        self.db.execute('BEGIN IMMEDIATE')
+        finished = self.db.execute(
+            "UPDATE chunks SET state = 'done', lease_expires = NULL WHERE first = ? AND worker = ? AND state = 'claimed'",
+            (first, self.worker),
+        ).rowcount == 1
+        if not finished:
+            self.db.execute('ROLLBACK')
+            raise LeaseLost(first)
+        self.db.execute(
+            'UPDATE workers SET last_seen = ?, chunks_done = chunks_done + 1, bugs_fetched = bugs_fetched + ? WHERE worker = ?',
+            (time.time(), bugs_fetched, self.worker),
+        )
+        self.db.execute('COMMIT')
+
+    def print_report(self):
+        print('Chunks: %s' % ', '.join(
+            '%d %s' % (count, state)
+            for state, count in self.db.execute('SELECT state, COUNT(*) FROM chunks GROUP BY state')
+        ))
+        for worker, started_at, last_seen, chunks_done, bugs_fetched in self.db.execute(
+            'SELECT worker, started_at, last_seen, chunks_done, bugs_fetched FROM workers ORDER BY worker'
+        ):
+            elapsed = max(last_seen - started_at, 1.0)
+            print('  %s: %d bugs in %d chunks, %.2f bugs/s' % (worker, bugs_fetched, chunks_done, bugs_fetched / elapsed))
+
+
+def select_bug_ids(client, manifest, first, last):
+    if ENUMERATE_EXISTING_BUGS:
+        candidate_ids = query_existing_bug_ids(client, first, last)
+        print('Bugzilla reports %d existing bugs in %d-%d' % (len(candidate_ids), first, last))
     else:
-        cookies = {}
+        candidate_ids = range(first, last + 1)
+    all_bugzilla_ids = [id for id in candidate_ids if not already_fetched(id, manifest)]
+    print('Skipping %d bugs already listed in %s' % (len(candidate_ids) - len(all_bugzilla_ids), MANIFEST_FILENAME))
+    return all_bugzilla_ids
 
-    os.makedirs('xml', exist_ok=True)
+
+def fetch_all(client, all_bugzilla_ids, manifest_file, on_progress=None):
+    batches = [
+        all_bugzilla_ids[i:i + BUGS_PER_REQUEST]
+        for i in range(0, len(all_bugzilla_ids), BUGS_PER_REQUEST)
+    ]
     start_time = time.time()
-    for id in range(FIRST_BUGZILLA_NUMBER, LAST_BUGZILLA_NUMBER + 1):
-        r = requests.get(
-            '%s/show_bug.cgi?id=%d&ctype=xml' % (BUGZILLA_URL, id),
-            cookies=cookies,
-        )
-        assert r.status_code == 200, 'Unexpected HTTP %d response: %s' % (r.status_code, r.text)
-        xml = r.text
-        if cookies:
-            assert 'exporter=' in xml, 'Are your Bugzilla login cookies expired or misspelled?'
-        with open('xml/' + str(id) + '.xml', 'w') as f:
-            print(xml, file=f)
-        elapsed = time.time() - start_time
-        remaining = elapsed * (LAST_BUGZILLA_NUMBER - id) / (id - FIRST_BUGZILLA_NUMBER + 1)
-        print('Retrieved %d bugs in %.2fs; %ds remaining' % (id, elapsed, remaining))
+    processed = 0
+    with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_IN_FLIGHT_REQUESTS) as executor:
+        futures = [executor.submit(fetch_bugs, client, ids) for ids in batches]
+        try:
+            for future in concurrent.futures.as_completed(futures):
+                records = future.result()
+                for record in records:
+                    print(json.dumps(record), file=manifest_file)
+                manifest_file.flush()
+                ids = [record['id'] for record in records]
+                processed += len(ids)
+                elapsed = time.time() - start_time
+                remaining = elapsed * (len(all_bugzilla_ids) - processed) / processed
+                print('Retrieved bugs %d-%d (%d of %d) in %.2fs; %ds remaining' % (min(ids), max(ids), processed, len(all_bugzilla_ids), elapsed, remaining))
+                if on_progress is not None:
+                    on_progress()
+        except BaseException:
+            # Don't keep fetching thousands of queued bugs after a failure (or ^C).
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+
+
+if __name__ == '__main__':
+    client = make_client()
+    os.makedirs('xml', exist_ok=True)
+    os.makedirs('invalid-xml', exist_ok=True)
+    remove_stale_temporary_files()
+    manifest = load_manifest()
+    worker = '%s:%d' % (socket.gethostname(), os.getpid())
+    manifest_filename = MANIFEST_FILENAME if (COORDINATOR_DATABASE is None) else worker_manifest_filename(worker)
+    with open(manifest_filename, 'a') as manifest_file:
+        if INCREMENTAL_SYNC:
+            since = latest_delta_ts(manifest)
+            all_bugzilla_ids = query_changed_bug_ids(client, since)
+            print('Bugzilla reports %d bugs changed since %s' % (len(all_bugzilla_ids), since))
+            fetch_all(client, all_bugzilla_ids, manifest_file)
+        elif COORDINATOR_DATABASE is None:
+            all_bugzilla_ids = select_bug_ids(client, manifest, FIRST_BUGZILLA_NUMBER, LAST_BUGZILLA_NUMBER)
+            fetch_all(client, all_bugzilla_ids, manifest_file)
+        else:
+            queue = WorkQueue(COORDINATOR_DATABASE, worker)
+            queue.populate(FIRST_BUGZILLA_NUMBER, LAST_BUGZILLA_NUMBER, BUGS_PER_CHUNK)
+            while True:
+                chunk = queue.claim()
+                if chunk is None:
+                    break
+                first, last, reclaimed = chunk
+                print('Claimed bugs %d-%d%s' % (first, last, ' from a worker that stopped responding' if reclaimed else ''))
+                if reclaimed:
+                    # Its previous owner may have fetched some of it before it died.
+                    manifest = load_manifest()
+                queue.start_renewing(first)
+                try:
+                    all_bugzilla_ids = select_bug_ids(client, manifest, first, last)
+                    fetch_all(client, all_bugzilla_ids, manifest_file, on_progress=queue.check_lease)
+                    queue.stop_renewing()
+                    queue.finish(first, len(all_bugzilla_ids))
+                except LeaseLost:
+                    # Another worker has (re)claimed it; leave it to them.
+                    print('WARNING -- lost the lease on bugs %d-%d to another worker; abandoning them' % (first, last))
+                except BaseException:
+                    queue.release(first)
+                    raise
+                finally:
+                    if queue.renewer is not None:
+                        queue.stop_renewing()
+            queue.print_report()
+    client.print_stats()
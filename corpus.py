@@ -0,0 +1,158 @@
+# Shared by xml-to-json.py, xml-to-sqlite.py and labelmaker/xml-to-bz-map.py.
+#
+# Each of those scripts needs to look at every bug in xml/. Rather than each
+# globbing xml/*.xml and parsing every file for itself, each one provides a
+# Visitor, and corpus.walk() reads and parses each file just once, no matter
+# how many visitors it's given. For example, xml-to-json.py can bring
+# bugs.sqlite up to date in the same pass (see ALSO_UPDATE_SQLITE_INDEX).
+#
+# The work is spread over `jobs` worker processes. For each bug, every
+# visitor's visit() runs in a worker and returns a (picklable) result; then
+# its collect() gets that result back in the main process, in bug-number order.
+#
+# Bugs are parsed lazily: visit() gets a Bug, and the file is parsed only
+# when some visitor first asks for its contents (so a visitor that can tell
+# from the file's hash that it has nothing to do costs next to nothing).
+# Nor do we usually need to read the file to hash it: bugzilla-to-xml.py
+# recorded each file's size and SHA-256 in its manifest as it wrote it.
+# A visitor that needs only a few of the bug's fields should list them in
+# `fields`; if every visitor does, only those fields are parsed at all.
+
+import bzreader
+import glob
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+import time
+
+
+class Visitor:
+    # The children of <bug> that visit() looks at, or None for all of them.
+    fields = None
+
+    def start(self):
+        # Runs in the main process, after the workers have started.
+        # Open output files and databases here, not in __init__.
+        pass
+
+    def visit(self, bug):
+        # Runs in a worker process. Must not touch anything opened by start().
+        return None
+
+    def collect(self, id, result):
+        # Runs in the main process, once per bug, in order.
+        pass
+
+    def finish(self):
+        pass
+
+
+class Bug:
+    def __init__(self, id, fields, manifest_record=None):
+        self.id = id
+        self.fname = 'xml/%d.xml' % id
+        self.fields = fields
+        self.manifest_record = manifest_record
+        self.parsed = None
+
+    def sha256(self):
+        # Trust the manifest as long as the file is still the size it recorded;
+        # a file rewritten since (say, by xml-to-attachments.py) gets hashed.
+        record = self.manifest_record
+        if (record is not None) and (record['size'] == os.path.getsize(self.fname)):
+            return record['sha256']
+        return file_sha256(self.fname)
+
+    def parse(self):
+        # Exactly what bzreader.parse(self.fname) would return,
+        # minus any <bug> children that no visitor asked for.
+        if self.parsed is None:
+            self.parsed = bzreader.parse(self.fname, fields=self.fields)
+        return self.parsed
+
+    def __getitem__(self, key):
+        return self.parse()['bugzilla']['bug'][key]
+
+    def get(self, key, default=None):
+        return self.parse()['bugzilla']['bug'].get(key, default)
+
+
+def file_sha256(fname):
+    with open(fname, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def load_xml_manifest():
+    # The records that bugzilla-to-xml.py wrote into xml-manifest.jsonl (and,
+    # if it ran with a COORDINATOR_DATABASE, into one xml-manifest-*.jsonl per worker).
+    manifest = {}
+    for fname in sorted(glob.glob('xml-manifest*.jsonl')):
+        with open(fname) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                manifest[record['id']] = {'size': record['size'], 'sha256': record['sha256']}
+    return manifest
+
+
+def extract_id(fname, directory='xml', extension='xml'):
+    # Also for the json/<id>.json files, and the github-json/<id>.json export.
+    m = re.match(r'%s/([0-9]+)\.%s$' % (re.escape(directory), re.escape(extension)), fname)
+    assert m, 'Unexpected filename %s in %s/ subdirectory' % (fname, directory)
+    return int(m.group(1))
+
+
+def all_bugzilla_ids():
+    return sorted([extract_id(fname) for fname in glob.glob('xml/*.xml')])
+
+
+def needed_fields(visitors):
+    if any(v.fields is None for v in visitors):
+        return None
+    return frozenset().union(*[v.fields for v in visitors])
+
+
+worker_visitors = None
+worker_manifest = None
+
+
+def start_worker(visitors, manifest):
+    global worker_visitors, worker_manifest
+    worker_visitors = visitors
+    worker_manifest = manifest
+
+
+def visit_bug(id):
+    bug = Bug(id, needed_fields(worker_visitors), worker_manifest.get(id))
+    try:
+        return id, [v.visit(bug) for v in worker_visitors]
+    except Exception as ex:
+        # Otherwise the traceback from a worker process doesn't say which bug it was.
+        raise RuntimeError('Failed to process xml/%d.xml' % id) from ex
+
+
+def walk(visitors, ids=None, jobs=os.cpu_count(), chunksize=64):
+    if ids is None:
+        ids = all_bugzilla_ids()
+    start_time = time.time()
+    processed = 0
+    manifest = load_xml_manifest()
+    with multiprocessing.Pool(jobs, initializer=start_worker, initargs=(visitors, manifest)) as pool:
+        for v in visitors:
+            v.start()
+        # imap hands out `chunksize` bugs at a time, but yields results in order,
+        # so the progress report below always counts a contiguous prefix of the bugs.
+        for id, results in pool.imap(visit_bug, ids, chunksize=chunksize):
+            for v, result in zip(visitors, results):
+                v.collect(id, result)
+            processed += 1
+            if processed % 100 == 0:
+                elapsed = time.time() - start_time
+                remaining = elapsed * (len(ids) - processed) / processed
+                print('Processed %d bugs (through %d.xml) in %.2fs; %ds remaining' % (processed, id, elapsed, remaining))
+    for v in visitors:
+        v.finish()
@@ -1,8 +1,9 @@
 #!/usr/bin/env python
 
+import httpclient
 import json
 import os
-import requests
+import ratelimit
 import time
 
 # This script works as-is for public repos.
@@ -13,6 +14,36 @@ import time
 
 GITHUB_REPOSITORY_NAME = 'llvm/llvm-project'
 GITHUB_API_TOKEN = os.environ.get('GITHUB_API_TOKEN', None)
+GITHUB_API_URL = os.environ.get('GITHUB_API_URL', 'https://api.github.com')
+
+# Each issue goes into github-json/<number>.json. (Not json/, where
+# xml-to-json.py keeps its files, named by Bugzilla ID.)
+
+# Every page we download is kept here, with its ETag, and asked for again
+# with If-None-Match; a page that hasn't changed comes back as a 304, which
+# is quick and doesn't use up the rate limit. In a full export, we list the
+# issues oldest first, so that new issues go on the last pages instead of
+# shifting all the others. The incremental listing (below) asks for different
+# URLs every run, so it never gets a 304; there the cache helps only with the
+# comments.
+HTTP_CACHE_DATABASE = 'github-cache.sqlite'
+
+# Set this to True to update an existing github-json/ instead of exporting
+# every issue: we ask GitHub only for the issues updated since the last run
+# started (less SINCE_MARGIN_SECONDS, in case our clock is ahead of GitHub's),
+# as recorded in SYNC_STATE_FILENAME. That listing is sorted by "updated_at",
+# so an issue updated while we're reading it jumps to the end, and a page
+# number would then skip whatever slid back into the pages we'd already read.
+# So instead of asking for the next page, we ask again, for the issues updated
+# since the last one we got. Either way, an issue whose "updated_at" matches its github-json/
+# file is left alone.
+INCREMENTAL_SYNC = False
+SYNC_STATE_FILENAME = 'github-to-json-state.json'
+SINCE_MARGIN_SECONDS = 600
+
+rate_limiter = ratelimit.AdaptiveRateLimiter(requests_per_second=1)
+client = httpclient.HttpClient(rate_limiter, headers=httpclient.github_headers(GITHUB_API_TOKEN))
+cache = httpclient.ResponseCache(HTTP_CACHE_DATABASE)
 
 
 def assert_status_code(r):
@@ -29,6 +60,13 @@ def assert_status_code(r):
     assert r.status_code == 200, 'ERROR -- HTTP %d was unexpected' % r.status_code
 
 
+def get_from_github(url):
+    r, body = cache.get(client, url)
+    if r.status_code != 304:
+        assert_status_code(r)
+    return json.loads(body)
+
+
 def clean_gh_comment_in_place(c):
     del c['url']
     del c['html_url']
@@ -53,17 +91,9 @@ def get_gh_comments(id):
     page = 0
     all_comments = []
     while True:
-        headers = {
-            'User-Agent': 'Script from https://github.com/Quuxplusone/BugzillaToGithub',
-        }
-        if GITHUB_API_TOKEN is not None:
-            headers['Authorization'] = 'token %s' % GITHUB_API_TOKEN
-        r = requests.get(
-            'https://api.github.com/repos/%s/issues/%d/comments?page=%d&per_page=100' % (GITHUB_REPOSITORY_NAME, id, page + 1),
-            headers=headers,
+        new_comments = get_from_github(
+            '%s/repos/%s/issues/%d/comments?page=%d&per_page=100' % (GITHUB_API_URL, GITHUB_REPOSITORY_NAME, id, page + 1),
         )
-        assert_status_code(r)
-        new_comments = r.json()
         assert type(new_comments) is list, 'ERROR -- JSON for comments is unexpectedly not a list on page %d of bug %d' % (page, id)
         all_comments += new_comments
         if len(new_comments) == 0:
@@ -104,23 +134,56 @@ def clean_gh_issue_in_place(issue):
     del issue['performed_via_github_app']
 
 
+def issues_url(page, since):
+    if since is None:
+        query = 'state=all&sort=created&direction=asc'
+    else:
+        query = 'state=all&sort=updated&direction=asc&since=%s' % since
+    return '%s/repos/%s/issues?%s&page=%d&per_page=100' % (GITHUB_API_URL, GITHUB_REPOSITORY_NAME, query, page + 1)
+
+
+def saved_updated_at(id):
+    try:
+        with open('github-json/%d.json' % id) as f:
+            return json.load(f)['issue']['updated_at']
+    except FileNotFoundError:
+        return None
+
+
+def utc_timestamp(t):
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(t))
+
+
+def load_sync_state():
+    if not os.path.exists(SYNC_STATE_FILENAME):
+        return {'since': None}
+    with open(SYNC_STATE_FILENAME) as f:
+        return json.load(f)
+
+
+def save_sync_state(state):
+    with open(SYNC_STATE_FILENAME + '.tmp', 'w') as f:
+        json.dump(state, f)
+    os.replace(SYNC_STATE_FILENAME + '.tmp', SYNC_STATE_FILENAME)
+
+
 if __name__ == '__main__':
-    os.makedirs('json', exist_ok=True)
+    os.makedirs('github-json', exist_ok=True)
+    state = load_sync_state()
+    since = None
+    if INCREMENTAL_SYNC:
+        since = state['since']
+        assert since is not None, 'No %s; do a full (non-incremental) export first' % SYNC_STATE_FILENAME
+        print('Asking GitHub for the issues updated since %s' % since)
     start_time = time.time()
+    state['since'] = utc_timestamp(start_time - SINCE_MARGIN_SECONDS)
     page = 0
+    pages = 0
     retrieved = 0
+    handled = set()
+    unchanged = 0
     while True:
-        headers = {
-            'User-Agent': 'Script from https://github.com/Quuxplusone/BugzillaToGithub',
-        }
-        if GITHUB_API_TOKEN is not None:
-            headers['Authorization'] = 'token %s' % GITHUB_API_TOKEN
-        r = requests.get(
-            'https://api.github.com/repos/%s/issues?state=all&page=%d&per_page=100' % (GITHUB_REPOSITORY_NAME, page + 1),
-            headers=headers,
-        )
-        assert_status_code(r)
-        bugs = r.json()
+        bugs = get_from_github(issues_url(page, since))
         assert type(bugs) is list, 'ERROR -- JSON is unexpectedly not a list on page %d' % page
         if len(bugs) == 0:
             break
@@ -132,6 +195,12 @@ if __name__ == '__main__':
                 print('WARNING -- bug without number on page %d!!' % page)
             else:
                 id = issue['number']
+                if (id, issue['updated_at']) in handled:
+                    continue
+                handled.add((id, issue['updated_at']))
+                if saved_updated_at(id) == issue['updated_at']:
+                    unchanged += 1
+                    continue
                 print('Fetching issue %d' % id)
                 bug = {
                     "issue": issue,
@@ -139,9 +208,21 @@ if __name__ == '__main__':
                 }
                 if issue['comments'] != 0:
                     bug["comments"] = get_gh_comments(id)
-                with open('json/' + str(id) + '.json', 'w') as f:
+                # Write it atomically, so that a half-written file can't look up to date next time.
+                with open('github-json/' + str(id) + '.json.tmp', 'w') as f:
                     print(json.dumps(bug, indent=2), file=f)
-        page += 1
+                os.replace('github-json/' + str(id) + '.json.tmp', 'github-json/' + str(id) + '.json')
+        if (since is not None) and (bugs[-1]['updated_at'] > since):
+            # The issues updated at exactly that second come back again;
+            # they're in handled, so we skip them.
+            since = bugs[-1]['updated_at']
+            page = 0
+        else:
+            page += 1
+        pages += 1
         retrieved += len(bugs)
         elapsed = time.time() - start_time
-        print('Retrieved %d pages containing %d bugs in %.2fs; ???s remaining' % (page, retrieved, elapsed))
+        print('Retrieved %d pages containing %d bugs in %.2fs; ???s remaining' % (pages, retrieved, elapsed))
+    save_sync_state(state)
+    print('%d issues were already up to date in github-json/' % unchanged)
+    client.print_stats()
@@ -0,0 +1,154 @@
+# The one place where the scripts in this repo make their HTTP requests.
+#
+# Calling requests.get or requests.post directly opens (and TLS-handshakes)
+# a fresh connection for every request, waits forever if the server stops
+# answering, and leaves us guessing where the hours of wall time went.
+# An HttpClient instead keeps one requests.Session, with a pool of keep-alive
+# connections for each host; gives every request a timeout; sends it through
+# the script's AdaptiveRateLimiter (which decides what to retry, and when);
+# and counts, for each endpoint, the requests and their statuses, the bytes
+# received, and the time spent waiting for the server to answer.
+#
+# Usage:
+#     client = httpclient.HttpClient(rate_limiter, headers=httpclient.github_headers(GITHUB_API_TOKEN))
+#     r = client.get(url)
+#     ...
+#     client.print_stats()
+#
+# An "endpoint" is the request's method, host, and path, with every number in
+# the path replaced by N (so all of /repos/x/y/issues/123/comments counts as
+# one endpoint). For a streamed response, we count the bytes as reported by
+# Content-Length, if the server sent one; and the time is the time until the
+# response headers arrived, not the time it took to read the body.
+
+import collections
+import re
+import requests
+import sqlite3
+import threading
+import urllib.parse
+import zlib
+
+USER_AGENT = 'Script from https://github.com/Quuxplusone/BugzillaToGithub'
+
+# Seconds to wait for a connection, and then for each read from it.
+DEFAULT_TIMEOUT = (10, 120)
+
+
+def github_headers(api_token):
+    headers = {
+        'User-Agent': USER_AGENT,
+    }
+    if api_token is not None:
+        headers['Authorization'] = 'token %s' % api_token
+    return headers
+
+
+def endpoint_name(method, url):
+    parts = urllib.parse.urlsplit(url)
+    return '%s %s%s' % (method, parts.netloc, re.sub(r'/[0-9]+(?=/|$)', '/N', parts.path))
+
+
+class EndpointStats:
+    def __init__(self):
+        self.requests = 0
+        self.statuses = collections.Counter()
+        self.bytes = 0
+        self.seconds = 0.0
+
+
+class HttpClient:
+    def __init__(self, rate_limiter, headers=None, cookies=None, max_connections_per_host=8, timeout=DEFAULT_TIMEOUT):
+        self.rate_limiter = rate_limiter
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=max_connections_per_host,
+        )
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers['User-Agent'] = USER_AGENT
+        if headers is not None:
+            self.session.headers.update(headers)
+        if cookies is not None:
+            self.session.cookies.update(cookies)
+        self.lock = threading.Lock()
+        self.stats = collections.defaultdict(EndpointStats)
+
+    def send(self, method, url, **kwargs):
+        # Exactly one attempt, with no pacing; for callers that do their own.
+        kwargs.setdefault('timeout', self.timeout)
+        endpoint = endpoint_name(method, url)
+        try:
+            r = self.session.request(method, url, **kwargs)
+        except requests.RequestException as ex:
+            self.record(endpoint, type(ex).__name__, 0, 0.0)
+            raise
+        if kwargs.get('stream'):
+            size = int(r.headers.get('Content-Length', 0))
+        else:
+            size = len(r.content)
+        self.record(endpoint, r.status_code, size, r.elapsed.total_seconds())
+        return r
+
+    def request(self, method, url, retry_server_errors=True, **kwargs):
+        # Paced by the rate limiter, which retries the request if it's throttled
+        # (and, unless retry_server_errors=False, if it fails with a 5xx).
+        return self.rate_limiter.request(self.send, method, url, retry_server_errors=retry_server_errors, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def record(self, endpoint, status, size, seconds):
+        with self.lock:
+            stats = self.stats[endpoint]
+            stats.requests += 1
+            stats.statuses[status] += 1
+            stats.bytes += size
+            stats.seconds += seconds
+
+    def print_stats(self):
+        with self.lock:
+            for endpoint, stats in sorted(self.stats.items()):
+                print('%s: %d requests (%s), %.1fMB, %.1fs waiting (%.3fs each)' % (
+                    endpoint, stats.requests,
+                    ', '.join('%d x %s' % (n, status) for status, n in sorted(stats.statuses.items(), key=str)),
+                    stats.bytes / 1e6, stats.seconds, stats.seconds / stats.requests,
+                ))
+
+
+class ResponseCache:
+    # Keeps the body of every GET response that came with an ETag or a
+    # Last-Modified header, in an SQLite file, so that the next request for
+    # the same URL can be made conditional. If the server answers 304 Not
+    # Modified, we use the body we kept. GitHub doesn't count 304s against
+    # your primary rate limit, as long as the request was authorized.
+    # Not thread-safe; delete the file to start over.
+    def __init__(self, fname):
+        self.db = sqlite3.connect(fname)
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS responses (url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, body BLOB NOT NULL) WITHOUT ROWID'
+        )
+
+    def get(self, client, url):
+        # Returns the response and its body; r.status_code is 304 if the body came from the cache.
+        row = self.db.execute('SELECT etag, last_modified, body FROM responses WHERE url = ?', (url,)).fetchone()
+        headers = {}
+        if row is not None:
+            if row[0] is not None:
+                headers['If-None-Match'] = row[0]
+            if row[1] is not None:
+                headers['If-Modified-Since'] = row[1]
+        r = client.get(url, headers=headers)
+        if (r.status_code == 304) and (row is not None):
+            return r, zlib.decompress(row[2])
+        if (r.status_code == 200) and (('ETag' in r.headers) or ('Last-Modified' in r.headers)):
+            self.db.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)', (
+                url, r.headers.get('ETag'), r.headers.get('Last-Modified'), zlib.compress(r.content),
+            ))
+            self.db.commit()
+        return r, r.content
@@ -1,10 +1,14 @@
 #!/usr/bin/env python
 
-import glob
+import collections
+import concurrent.futures
+import datetime
+import httpclient
 import json
+import jsonshards
 import os
+import ratelimit
 import re
-import requests
 import subprocess
 import time
 
@@ -19,9 +23,59 @@ import time
 
 GITHUB_REPOSITORY_NAME = 'Quuxplusone/ImportTest'
 GITHUB_API_TOKEN = os.environ['GITHUB_API_TOKEN']
+# Override this (with benchmarks/fake-servers.py running) for a dry run.
+GITHUB_API_URL = os.environ.get('GITHUB_API_URL', 'https://api.github.com')
 FIRST_BUGZILLA_ID = 1
 LAST_BUGZILLA_ID = 10000
 
+# Made by json-to-payloads.py, which does all the massaging and checking,
+# so that this script has nothing to do but send them.
+PAYLOADS_FILENAME = 'payloads.ndjson'
+
+# GitHub numbers imported issues in the order it receives them, and this step
+# can't be undone; so by default we send one request at a time, and don't send
+# the next until GitHub has answered the last. That takes about 17 hours.
+#
+# Raising MAX_IN_FLIGHT_REQUESTS opts into pipelining: a window of requests in
+# flight, which starts at one request, and opens by one more after every
+# RAMP_UP_AFTER consecutive successes, until GitHub first says we're over its
+# secondary rate limit; after that it stays one below the size that triggered
+# it. We still send the requests in order, a rate_limiter slot apart, and check
+# the responses in order. If GitHub rejects one, we stop sending, and retry it
+# (and everything sent after it) in order once GitHub is ready; if it rejected
+# one but accepted a later one, we halt. But that's detection, not prevention:
+# two requests sent in order over separate connections can arrive out of order,
+# and a request that fails with a 5xx may have been dropped while the ones sent
+# after it got through; either way, issues end up with the wrong numbers, for
+# good. Only opt in if you can live with that, or can delete the repository and
+# start over. Whatever happens, we wait for every request in flight, and journal
+# its response, before we stop.
+MAX_IN_FLIGHT_REQUESTS = 1
+RAMP_UP_AFTER = 50
+
+# GitHub's 202 Accepted doesn't mean the issue exists yet, only that it's queued
+# for import; the import can still fail. And this step is irreversible, so
+# after a crash we need to know exactly which issues made it. Therefore every
+# request, response, and final import status is appended (and fsync'ed) to
+# IMPORT_JOURNAL_FILENAME before we act on it. After every POLL_AFTER_SUBMISSIONS
+# imports, we ask GitHub for the status of all the pending ones in one go.
+# A rerun replays the journal, and carries on after the last bug GitHub accepted.
+IMPORT_JOURNAL_FILENAME = 'import-journal.jsonl'
+POLL_AFTER_SUBMISSIONS = 100
+POLL_INTERVAL_SECONDS = 10
+
+# A failed import leaves a gap in the issue numbering that no rerun can fill,
+# so the script won't carry on past one, even on a rerun, until you list its
+# bug here to say that you'd rather live with the gap than start over.
+ACCEPTED_FAILED_IMPORTS = []
+
+rate_limiter = ratelimit.AdaptiveRateLimiter(requests_per_second=1)
+client = httpclient.HttpClient(
+    rate_limiter,
+    headers=httpclient.github_headers(GITHUB_API_TOKEN),
+    max_connections_per_host=MAX_IN_FLIGHT_REQUESTS,
+)
+
 
 def submit_github_issue(payload):
     assert re.match(r'[A-Za-z0-9_-]+/[A-Za-z0-9_-]+', GITHUB_REPOSITORY_NAME)
@@ -37,78 +91,325 @@ def submit_github_issue(payload):
             '-X', 'POST',
             '-H', 'Authorization: token %s' % GITHUB_API_TOKEN,
             '-d', json.dumps(payload),
-            'https://api.github.com/repos/%s/import/issues' % GITHUB_REPOSITORY_NAME,
+            '%s/repos/%s/import/issues' % (GITHUB_API_URL, GITHUB_REPOSITORY_NAME),
         ])
     else:
-        r = requests.post(
-            'https://api.github.com/repos/%s/import/issues' % GITHUB_REPOSITORY_NAME,
-            headers={
-                'Authorization': 'token %s' % GITHUB_API_TOKEN,
-            },
+        # Just one attempt; submit_github_issues decides what to retry, and when,
+        # so that retries can't jump ahead of issues sent after them.
+        return client.send(
+            'POST',
+            '%s/repos/%s/import/issues' % (GITHUB_API_URL, GITHUB_REPOSITORY_NAME),
             data=json.dumps(payload),
         )
-        assert r.status_code != 401, 'ERROR -- HTTP 401 Unauthorized -- is your API token expired or misspelled?'
-        assert r.status_code == 202, 'Expected HTTP 202 Accepted, not HTTP %d: %s' % (r.status_code, r.text)
-        print(r.text)
-
-
-def bugzilla_to_github_user(username):
-    # TODO FIXME BUG HACK
-    return None
-
-
-def dumb_down_comment(c):
-    # https://gist.github.com/jonmagic/5282384165e0f86ef105#supported-issue-and-comment-fields
-    return {
-        "created_at": c['created_at'],
-        "body": c['body'],
-    }
-
-
-def dumb_down_issue(gh):
-    # https://gist.github.com/jonmagic/5282384165e0f86ef105#supported-issue-and-comment-fields
-    # Notice that if you don't set a "closed_at" timestamp, then GitHub will assume
-    # the issue got closed at the time of the API call, screwing up its last-modified time.
-    # Therefore, we explicitly backdate the "closed_at" time.
-    return {
-        "issue": {
-            "title": gh['issue']['title'],
-            "body": gh['issue']['body'],
-            "created_at": gh['issue']['created_at'],
-            "closed_at": gh['issue']['updated_at'],
-            "updated_at": gh['issue']['updated_at'],
-            "assignee": bugzilla_to_github_user(gh['issue'].get('assignee', {}).get('login', None)),
-            # "milestone": None,
-            "closed": (gh['issue']['state'] == 'closed'),
-            "labels": [tag['name'] for tag in gh['issue']['labels']],
-        },
-        "comments": [
-            # GitHub rejects (and Bugzilla hides) comments with no body text.
-            dumb_down_comment(c) for c in gh['comments'] if c['body']
-        ]
-    }
-
-
-def extract_id(fname):
-    m = re.match(r'json/([0-9]+).json', fname)
-    assert m, 'Unexpected filename %s in json/ subdirectory' % fname
-    return int(m.group(1))
+
+
+def assert_accepted(r):
+    assert r.status_code != 401, 'ERROR -- HTTP 401 Unauthorized -- is your API token expired or misspelled?'
+    assert r.status_code == 202, 'Expected HTTP 202 Accepted, not HTTP %d: %s' % (r.status_code, r.text)
+
+
+class ImportWindow:
+    def __init__(self, max_in_flight, ramp_up_after):
+        self.size = 1
+        self.ceiling = max_in_flight
+        self.ramp_up_after = ramp_up_after
+        self.streak = 0
+
+    def succeeded(self):
+        self.streak += 1
+        if (self.streak >= self.ramp_up_after) and (self.size < self.ceiling):
+            self.size += 1
+            self.streak = 0
+            print('Opening the window to %d requests in flight' % self.size)
+
+    def throttled(self):
+        self.ceiling = max(1, self.size - 1)
+        self.size = self.ceiling
+        self.streak = 0
+        print('Closing the window to %d requests in flight, for good' % self.size)
+
+
+def journal_response(journal, id, r):
+    # Records what became of a request, as far as we can tell from r (None if
+    # we never got a response at all). GitHub may or may not have received a
+    # request that got a 5xx or no response; those stay unanswered in the
+    # journal, and the next run asks GitHub (see resolve_unanswered_requests).
+    if (r is None) or (r.status_code >= 500):
+        return
+    if r.status_code == 202:
+        status = r.json()
+        journal.append({'event': 'submitted', 'bug_id': id, 'import_id': status['id'], 'created_at': status['created_at']})
+    else:
+        journal.append({'event': 'rejected', 'bug_id': id})
+
+
+def drain(in_flight, journal):
+    # Waits for every request still in flight, and journals each response,
+    # so that we can stop without losing track of any of them.
+    # Returns a list of (id, payload, r), with r None if the request raised.
+    results = []
+    while in_flight:
+        id, payload, future = in_flight.popleft()
+        try:
+            r = future.result()
+        except Exception:
+            r = None
+        journal_response(journal, id, r)
+        results.append((id, payload, r))
+    return results
+
+
+def assert_none_accepted(id, later):
+    for later_id, _, later_r in later:
+        assert (later_r is None) or (later_r.status_code != 202), (
+            'ERROR -- GitHub rejected bug %d but then accepted bug %d; '
+            'their issue numbers will be out of order' % (id, later_id)
+        )
+
+
+def submit_github_issues(all_payloads, journal):
+    # Yields the id of each (id, payload) in order, as GitHub accepts it.
+    window = ImportWindow(MAX_IN_FLIGHT_REQUESTS, RAMP_UP_AFTER)
+    all_payloads = iter(all_payloads)
+    to_retry = collections.deque()
+    in_flight = collections.deque()
+    throttles = 0
+    with concurrent.futures.ThreadPoolExecutor(MAX_IN_FLIGHT_REQUESTS) as executor:
+        while True:
+            while len(in_flight) < window.size:
+                next_payload = to_retry.popleft() if to_retry else next(all_payloads, None)
+                if next_payload is None:
+                    break
+                rate_limiter.wait()
+                journal.append({'event': 'sending', 'bug_id': next_payload[0], 'sent_at': utc_now()})
+                in_flight.append(next_payload + (executor.submit(submit_github_issue, next_payload[1]),))
+            if not in_flight:
+                break
+            id, payload, future = in_flight.popleft()
+            try:
+                r = future.result()
+            except Exception:
+                drain(in_flight, journal)
+                raise
+            if ratelimit.is_throttled(r):
+                # Everything sent after it must be rejected too, or the numbering is broken.
+                journal_response(journal, id, r)
+                later = drain(in_flight, journal)
+                assert_none_accepted(id, later)
+                for later_id, _, later_r in later:
+                    assert later_r is not None, 'ERROR -- no response for bug %d; rerun to find out whether GitHub got it' % later_id
+                    if not ratelimit.is_throttled(later_r):
+                        assert_accepted(later_r)
+                throttles += 1
+                window.throttled()
+                rate_limiter.pause(ratelimit.throttled_seconds(r, throttles), 'HTTP %d, rate limited at bug %d' % (r.status_code, id))
+                to_retry.extendleft(reversed([(id, payload)] + [(later_id, later_payload) for later_id, later_payload, _ in later]))
+                continue
+            if r.status_code != 202:
+                journal_response(journal, id, r)
+                later = drain(in_flight, journal)
+                if r.status_code < 500:
+                    assert_none_accepted(id, later)
+                assert_accepted(r)
+            print(r.text)
+            journal_response(journal, id, r)
+            throttles = 0
+            window.succeeded()
+            rate_limiter.succeed(r)
+            yield id
+
+
+def utc_now():
+    return datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+class ImportJournal:
+    # One JSON object per line, each with an 'event' and a 'bug_id':
+    #     sending    -- we're about to POST this bug (we may never hear back)
+    #     rejected   -- GitHub refused it, or never received it; it's safe to resend
+    #     submitted  -- GitHub accepted it, as import_id, at created_at
+    #     imported   -- the import finished, as issue_number
+    #     failed     -- the import failed, with GitHub's errors
+    def __init__(self, fname):
+        self.unanswered = {}  # bug_id -> sent_at, for requests we never heard back from
+        self.import_ids = set()
+        self.pending = {}     # import_id -> its 'submitted' record
+        self.submitted = set()
+        self.failed = {}      # bug_id -> its 'failed' record
+        self.imported = 0
+        if os.path.exists(fname):
+            with open(fname, 'rb+') as f:
+                data = f.read()
+                # A crash in mid-append leaves a partial last line; drop it.
+                f.truncate(data.rfind(b'\n') + 1)
+            for line in data[:data.rfind(b'\n') + 1].splitlines():
+                self.replay(json.loads(line))
+        self.f = open(fname, 'a')
+
+    def replay(self, record):
+        event = record['event']
+        bug_id = record['bug_id']
+        if event == 'sending':
+            self.unanswered[bug_id] = record['sent_at']
+        elif event == 'rejected':
+            self.unanswered.pop(bug_id, None)
+        elif event == 'submitted':
+            self.unanswered.pop(bug_id, None)
+            self.import_ids.add(record['import_id'])
+            self.pending[record['import_id']] = record
+            self.submitted.add(bug_id)
+        elif event == 'imported':
+            self.pending.pop(record['import_id'], None)
+            self.imported += 1
+        elif event == 'failed':
+            self.pending.pop(record['import_id'], None)
+            self.failed[bug_id] = record
+        else:
+            assert False, 'Unexpected event %r in %s' % (event, IMPORT_JOURNAL_FILENAME)
+
+    def append(self, record):
+        self.replay(record)
+        print(json.dumps(record), file=self.f)
+        self.f.flush()
+        os.fsync(self.f.fileno())
+
+
+def get_from_github(url, params=None):
+    r = client.get(url, params=params)
+    assert r.status_code != 401, 'ERROR -- HTTP 401 Unauthorized -- is your API token expired or misspelled?'
+    assert r.status_code == 200, 'Expected HTTP 200 OK, not HTTP %d: %s' % (r.status_code, r.text)
+    return r
+
+
+def list_imports(since):
+    # GitHub lists the status of every import created since the given time,
+    # a page at a time; that's far fewer requests than asking about each import.
+    url = '%s/repos/%s/import/issues' % (GITHUB_API_URL, GITHUB_REPOSITORY_NAME)
+    params = {'since': since, 'per_page': 100}
+    while url is not None:
+        r = get_from_github(url, params)
+        yield from r.json()
+        url = r.links.get('next', {}).get('url')
+        params = None
+
+
+def poll_pending_imports(journal):
+    # Returns the bug_ids whose imports turned out to have failed.
+    if not journal.pending:
+        return []
+    newly_failed = []
+    for status in list_imports(min(record['created_at'] for record in journal.pending.values())):
+        record = journal.pending.get(status['id'])
+        if record is None:
+            continue
+        bug_id = record['bug_id']
+        if status['status'] == 'imported':
+            issue_number = int(status['issue_url'].rsplit('/', 1)[1])
+            journal.append({'event': 'imported', 'bug_id': bug_id, 'import_id': status['id'], 'issue_number': issue_number})
+        elif status['status'] == 'failed':
+            journal.append({'event': 'failed', 'bug_id': bug_id, 'import_id': status['id'], 'errors': status.get('errors')})
+            newly_failed.append(bug_id)
+    return newly_failed
+
+
+def assert_none_failed(bug_ids, journal):
+    bug_ids = [id for id in bug_ids if id not in ACCEPTED_FAILED_IMPORTS]
+    assert not bug_ids, (
+        'ERROR -- GitHub failed to import bug %d: %s -- the issues imported after it are numbered '
+        'one lower than they should be. Either delete the repository and start over, or add %d to '
+        'ACCEPTED_FAILED_IMPORTS and rerun to carry on with the gap.' % (bug_ids[0], journal.failed[bug_ids[0]]['errors'], bug_ids[0])
+    )
+
+
+def resolve_unanswered_requests(journal):
+    # If the last run died with requests in flight, we don't know whether
+    # GitHub got them. Any import GitHub has that we never heard about
+    # must be one of them: we find out which by its issue's title.
+    # The rest never arrived, and it's safe to send them again.
+    if not journal.unanswered:
+        return
+    earliest = datetime.datetime.strptime(min(journal.unanswered.values()), '%Y-%m-%dT%H:%M:%SZ')
+    # Allow for our clock being a bit ahead of GitHub's.
+    since = (earliest - datetime.timedelta(minutes=10)).strftime('%Y-%m-%dT%H:%M:%SZ')
+    orphans = [status for status in list_imports(since) if status['id'] not in journal.import_ids]
+    if orphans:
+        unanswered_titles = collections.defaultdict(list)
+        for id, payload in read_payloads(journal.unanswered):
+            unanswered_titles[payload['issue']['title']].append(id)
+    for status in orphans:
+        while status['status'] == 'pending':
+            time.sleep(POLL_INTERVAL_SECONDS)
+            status = get_from_github(status['url']).json()
+        assert status['status'] == 'imported', (
+            'ERROR -- the last run stopped without hearing back about bugs %s, and GitHub has a failed '
+            'import %d that %s has no record of: %s' % (sorted(journal.unanswered), status['id'], IMPORT_JOURNAL_FILENAME, status.get('errors'))
+        )
+        issue = get_from_github(status['issue_url']).json()
+        bug_ids = unanswered_titles.get(issue['title'], [])
+        assert len(bug_ids) == 1, (
+            'ERROR -- the last run stopped without hearing back about bugs %s, and GitHub has an import %d '
+            '(issue #%d) that %s has no record of. Find out which bug it is before rerunning.' % (
+                sorted(journal.unanswered), status['id'], issue['number'], IMPORT_JOURNAL_FILENAME,
+            )
+        )
+        print('Found bug %d, sent just before the last run stopped, as issue #%d' % (bug_ids[0], issue['number']))
+        journal.append({'event': 'submitted', 'bug_id': bug_ids[0], 'import_id': status['id'], 'created_at': status['created_at']})
+        journal.append({'event': 'imported', 'bug_id': bug_ids[0], 'import_id': status['id'], 'issue_number': issue['number']})
+    for bug_id in sorted(journal.unanswered):
+        journal.append({'event': 'rejected', 'bug_id': bug_id})
+
+
+def all_payload_ids():
+    # json-to-payloads.py writes each line as {"id":123,"payload":...},
+    # so we can list the ids without parsing every payload.
+    with open(PAYLOADS_FILENAME, 'rb') as f:
+        return [int(re.match(rb'\{"id":([0-9]+),', line).group(1)) for line in f]
+
+
+def read_payloads(ids):
+    # Yields (id, payload) for each of the given ids, in file order.
+    ids = set(ids)
+    with open(PAYLOADS_FILENAME, 'rb') as f:
+        for line in f:
+            record = jsonshards.loads(line)
+            if record['id'] in ids:
+                yield record['id'], record['payload']
 
 
 if __name__ == '__main__':
-    os.makedirs('json', exist_ok=True)
-    all_json_filenames = glob.glob('json/*.json')
-    all_bugzilla_ids = [extract_id(fname) for fname in all_json_filenames]
-    all_bugzilla_ids = sorted([id for id in all_bugzilla_ids if FIRST_BUGZILLA_ID <= id <= LAST_BUGZILLA_ID])
+    journal = ImportJournal(IMPORT_JOURNAL_FILENAME)
+    resolve_unanswered_requests(journal)
+    poll_pending_imports(journal)
+    assert_none_failed(sorted(journal.failed), journal)
+    for bug_id, record in sorted(journal.failed.items()):
+        print('WARNING -- GitHub failed to import bug %d: %s; carrying on without it, per ACCEPTED_FAILED_IMPORTS' % (bug_id, record['errors']))
+    assert os.path.exists(PAYLOADS_FILENAME), 'No %s; run ./json-to-payloads.py first' % PAYLOADS_FILENAME
+    all_bugzilla_ids = sorted([id for id in all_payload_ids() if FIRST_BUGZILLA_ID <= id <= LAST_BUGZILLA_ID])
+    if journal.submitted:
+        print('Skipping %d bugs already submitted, according to %s' % (len(journal.submitted), IMPORT_JOURNAL_FILENAME))
+        all_bugzilla_ids = [id for id in all_bugzilla_ids if id not in journal.submitted]
+        # Skipping the missing bug would leave the numbering just as wrong as
+        # importing it late; either way, it's for a human to sort out.
+        assert (not all_bugzilla_ids) or (all_bugzilla_ids[0] > max(journal.submitted)), (
+            'ERROR -- bug %d was never imported, but the later bug %d was, so the issue numbers '
+            'after it are already out of order. If GitHub has bug %d after all, record its import '
+            'in %s (as a "submitted" record) and rerun; otherwise the only fix is to delete the repository and start over.' % (
+                all_bugzilla_ids[0], max(journal.submitted), all_bugzilla_ids[0], IMPORT_JOURNAL_FILENAME,
+            )
+        )
+    all_payloads = read_payloads(all_bugzilla_ids)
     start_time = time.time()
     processed = 0
-    for id in all_bugzilla_ids:
-        print('Parsing %d.json' % id)
-        with open('json/%d.json' % id) as f:
-            gh = json.load(f)
-        payload = dumb_down_issue(gh)
-        submit_github_issue(payload)
+    for id in submit_github_issues(all_payloads, journal):
         processed += 1
         elapsed = time.time() - start_time
         remaining = elapsed * (len(all_bugzilla_ids) - processed) / processed
         print('Processed %d bugs in %.2fs; %ds remaining' % (processed, elapsed, remaining))
+        if processed % POLL_AFTER_SUBMISSIONS == 0:
+            assert_none_failed(poll_pending_imports(journal), journal)
+    while journal.pending:
+        print('Waiting for %d imports to finish' % len(journal.pending))
+        time.sleep(POLL_INTERVAL_SECONDS)
+        assert_none_failed(poll_pending_imports(journal), journal)
+    print('%d issues imported in all, according to %s' % (journal.imported, IMPORT_JOURNAL_FILENAME))
+    client.print_stats()
@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+
+import corpus
+import glob
+import json
+import jsonshards
+import os
+import re
+import time
+
+# This script turns each bug in json/ into exactly the payload that
+# json-to-github.py will send to GitHub's Issues Import API, and writes them
+# all, in order, to PAYLOADS_FILENAME. Doing this up front means that Step 4
+# (which is irreversible, and can't skip a bug without throwing off the
+# issue numbering) never stops halfway because of one bad payload.
+#
+# GitHub rejects any issue or comment whose body is longer than 65536
+# characters. That happens: the summary table plus a monospaced testcase
+# can be longer than that, and so can a comment with a pasted build log.
+# We split such a body into pieces at line breaks where we can, and post the
+# pieces after the first as continuation comments with the same timestamp.
+# If a piece ends inside a ``` code block, we close the block and reopen it
+# in the next piece, so the rest still renders as code.
+#
+# Everything else GitHub is known to check is checked here too. If any
+# payload is still unacceptable, we list every problem and write nothing.
+
+# Set this if you ran xml-to-json.py with WRITE_NDJSON_SHARDS = True;
+# the bugs are then streamed out of json-shards/ instead of json/.
+READ_NDJSON_SHARDS = False
+PAYLOADS_FILENAME = 'payloads.ndjson'
+
+MAX_BODY_LENGTH = 65536
+MAX_TITLE_LENGTH = 256
+MAX_LABEL_LENGTH = 50
+
+# The import API wants its timestamps in exactly this ISO 8601 form.
+TIMESTAMP_RX = re.compile(r'[0-9]{4}-[0-9]{2}-[0-9]{2}T[0-9]{2}:[0-9]{2}:[0-9]{2}Z')
+FENCE_RX = re.compile(r'^```', re.MULTILINE)
+
+ISSUE_CONTINUATION = '_(Continued from the issue description: part %d of %d.)_\n\n'
+COMMENT_CONTINUATION = '_(Continued from the previous comment: part %d of %d.)_\n\n'
+# Enough room for the continuation line, and for closing a code block.
+CONTINUATION_ROOM = 100
+
+
+def bugzilla_to_github_user(username):
+    # TODO FIXME BUG HACK
+    return None
+
+
+def dumb_down_comment(c):
+    # https://gist.github.com/jonmagic/5282384165e0f86ef105#supported-issue-and-comment-fields
+    return {
+        "created_at": c['created_at'],
+        "body": c['body'],
+    }
+
+
+def dumb_down_issue(gh):
+    # https://gist.github.com/jonmagic/5282384165e0f86ef105#supported-issue-and-comment-fields
+    # Notice that if you don't set a "closed_at" timestamp, then GitHub will assume
+    # the issue got closed at the time of the API call, screwing up its last-modified time.
+    # Therefore, we explicitly backdate the "closed_at" time.
+    return {
+        "issue": {
+            "title": gh['issue']['title'],
+            "body": gh['issue']['body'],
+            "created_at": gh['issue']['created_at'],
+            "closed_at": gh['issue']['updated_at'],
+            "updated_at": gh['issue']['updated_at'],
+            "assignee": bugzilla_to_github_user(gh['issue'].get('assignee', {}).get('login', None)),
+            # "milestone": None,
+            "closed": (gh['issue']['state'] == 'closed'),
+            "labels": [tag['name'] for tag in gh['issue']['labels']],
+        },
+        "comments": [
+            # GitHub rejects (and Bugzilla hides) comments with no body text.
+            dumb_down_comment(c) for c in gh['comments'] if c['body']
+        ]
+    }
+
+
+def split_body(body, max_length):
+    # Returns a list of pieces, each no longer than max_length,
+    # that read the same as the body when rendered one after another.
+    pieces = []
+    in_code_block = False
+    while True:
+        piece = ('```\n' if in_code_block else '') + body
+        if len(piece) <= max_length:
+            pieces.append(piece)
+            return pieces
+        room = max_length - len('```\n') - len('\n```\n')
+        cut = body.rfind('\n', 0, room) + 1
+        if cut < room // 2:
+            # There's no good line break; just cut in the middle of the line.
+            cut = room
+        piece = ('```\n' if in_code_block else '') + body[:cut]
+        body = body[cut:]
+        in_code_block = (len(FENCE_RX.findall(piece)) % 2 == 1)
+        if in_code_block:
+            piece += ('' if piece.endswith('\n') else '\n') + '```\n'
+        pieces.append(piece)
+
+
+def split_long_bodies(payload):
+    # Returns the payload with every body short enough for GitHub.
+    # The result depends only on the payload, so rerunning this script
+    # always produces the same continuation comments.
+    issue = payload['issue']
+    max_length = MAX_BODY_LENGTH - CONTINUATION_ROOM
+    comments = []
+    pieces = split_body(issue['body'], max_length)
+    issue = dict(issue, body=pieces[0])
+    for i, piece in enumerate(pieces[1:], start=2):
+        comments.append({
+            "created_at": issue['created_at'],
+            "body": (ISSUE_CONTINUATION % (i, len(pieces))) + piece,
+        })
+    for c in payload['comments']:
+        pieces = split_body(c['body'], max_length)
+        comments.append(dict(c, body=pieces[0]))
+        for i, piece in enumerate(pieces[1:], start=2):
+            comments.append(dict(c, body=(COMMENT_CONTINUATION % (i, len(pieces))) + piece))
+    return {"issue": issue, "comments": comments}
+
+
+def find_problems(payload):
+    issue = payload['issue']
+    problems = []
+    if not (isinstance(issue['title'], str) and (0 < len(issue['title']) <= MAX_TITLE_LENGTH)):
+        problems.append('title must be 1 to %d characters, not %r' % (MAX_TITLE_LENGTH, issue['title']))
+    for key in ['created_at', 'updated_at', 'closed_at']:
+        if not (isinstance(issue[key], str) and TIMESTAMP_RX.fullmatch(issue[key])):
+            problems.append('issue %s %r is not a timestamp like 2021-12-11T00:00:00Z' % (key, issue[key]))
+    if type(issue['closed']) is not bool:
+        problems.append('closed must be true or false, not %r' % issue['closed'])
+    for label in issue['labels']:
+        if not (isinstance(label, str) and (0 < len(label) <= MAX_LABEL_LENGTH)):
+            problems.append('label must be 1 to %d characters, not %r' % (MAX_LABEL_LENGTH, label))
+    if len(issue['body']) > MAX_BODY_LENGTH:
+        problems.append('issue body is %d characters long' % len(issue['body']))
+    for i, c in enumerate(payload['comments']):
+        if not (isinstance(c['created_at'], str) and TIMESTAMP_RX.fullmatch(c['created_at'])):
+            problems.append('comment %d created_at %r is not a timestamp like 2021-12-11T00:00:00Z' % (i, c['created_at']))
+        if not (0 < len(c['body']) <= MAX_BODY_LENGTH):
+            problems.append('comment %d body is %d characters long' % (i, len(c['body'])))
+    return problems
+
+
+def read_json_files(all_bugzilla_ids):
+    for id in all_bugzilla_ids:
+        with open('json/%d.json' % id) as f:
+            yield id, json.load(f)
+
+
+if __name__ == '__main__':
+    if READ_NDJSON_SHARDS:
+        index = jsonshards.load_index()
+        all_bugzilla_ids = sorted(index.keys())
+        all_bugs = jsonshards.read_bugs(index, all_bugzilla_ids)
+    else:
+        all_json_filenames = glob.glob('json/*.json')
+        all_bugzilla_ids = sorted([corpus.extract_id(fname, 'json', 'json') for fname in all_json_filenames])
+        all_bugs = read_json_files(all_bugzilla_ids)
+    start_time = time.time()
+    processed = 0
+    split = 0
+    problems = []
+    with open(PAYLOADS_FILENAME + '.tmp', 'wb') as f:
+        for id, gh in all_bugs:
+            payload = dumb_down_issue(gh)
+            ready = split_long_bodies(payload)
+            if len(ready['comments']) != len(payload['comments']):
+                split += 1
+            problems += ['bug %d: %s' % (id, problem) for problem in find_problems(ready)]
+            f.write(jsonshards.dumps({"id": id, "payload": ready}) + b'\n')
+            processed += 1
+            if processed % 1000 == 0:
+                elapsed = time.time() - start_time
+                remaining = elapsed * (len(all_bugzilla_ids) - processed) / processed
+                print('Processed %d bugs in %.2fs; %ds remaining' % (processed, elapsed, remaining))
+    if problems:
+        os.remove(PAYLOADS_FILENAME + '.tmp')
+        for problem in problems:
+            print('ERROR -- %s' % problem)
+        assert not problems, 'ERROR -- %s not written; fix the problems above and rerun' % PAYLOADS_FILENAME
+    os.replace(PAYLOADS_FILENAME + '.tmp', PAYLOADS_FILENAME)
+    print('Wrote %d payloads to %s; %d of them had bodies too long for GitHub, which were split' % (processed, PAYLOADS_FILENAME, split))
@@ -0,0 +1,124 @@
+# Shared by xml-to-json.py and json-to-github.py.
+#
+# An alternative to writing one pretty-printed json/<id>.json file per bug
+# (51567 files, 349MB, mostly whitespace): compact newline-delimited JSON,
+# one bug per line, in a handful of size-bounded shards
+#     json-shards/shard-0000.ndjson
+#     json-shards/shard-0001.ndjson
+#     ...
+# plus json-shards/index.jsonl, which records for each bug the shard it's in
+# and the byte offset and length of its line, so that a reader can seek
+# straight to any bug without parsing the ones before it.
+#
+# If the shards are compressed (shard-0000.ndjson.gz), each line is its own
+# gzip member. The concatenation is still a valid gzip file (so `zcat` and
+# gzip.open work as usual), and the offsets still let us seek to any bug.
+#
+# We use orjson if it's installed, since it's several times faster than
+# the standard json module; the output means the same either way.
+
+import gzip
+import json
+import os
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+SHARDS_DIRECTORY = 'json-shards'
+INDEX_FILENAME = os.path.join(SHARDS_DIRECTORY, 'index.jsonl')
+
+
+def dumps(obj):
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+def loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def encode_record(obj, compress):
+    # This is the expensive part, so xml-to-json.py does it in its worker processes.
+    line = dumps(obj) + b'\n'
+    return gzip.compress(line) if compress else line
+
+
+def decode_record(data, compress):
+    return loads(gzip.decompress(data) if compress else data)
+
+
+class ShardWriter:
+    def __init__(self, max_bytes, compress):
+        self.max_bytes = max_bytes
+        self.compress = compress
+        self.shard = None
+        self.f = None
+        self.shard_names = []
+        self.index = []
+        os.makedirs(SHARDS_DIRECTORY, exist_ok=True)
+        # Until we've finished, there's no consistent set of shards to point at.
+        if os.path.exists(INDEX_FILENAME):
+            os.remove(INDEX_FILENAME)
+
+    def write(self, id, record):
+        if (self.f is None) or (self.f.tell() > 0 and self.f.tell() + len(record) > self.max_bytes):
+            self.finish_shard()
+            self.shard = 'shard-%04d.ndjson%s' % (len(self.shard_names), '.gz' if self.compress else '')
+            self.shard_names.append(self.shard)
+            self.f = open(os.path.join(SHARDS_DIRECTORY, self.shard + '.tmp'), 'wb')
+        self.index.append({'id': id, 'shard': self.shard, 'offset': self.f.tell(), 'length': len(record)})
+        self.f.write(record)
+
+    def finish_shard(self):
+        if self.f is not None:
+            self.f.flush()
+            os.fsync(self.f.fileno())
+            self.f.close()
+            os.replace(self.f.name, os.path.join(SHARDS_DIRECTORY, self.shard))
+            self.f = None
+
+    def close(self):
+        self.finish_shard()
+        with open(INDEX_FILENAME + '.tmp', 'w') as f:
+            for entry in self.index:
+                print(json.dumps(entry), file=f)
+        os.replace(INDEX_FILENAME + '.tmp', INDEX_FILENAME)
+        # Clean up any leftover shards from a previous, bigger run.
+        for fname in os.listdir(SHARDS_DIRECTORY):
+            if fname.startswith('shard-') and fname not in self.shard_names:
+                os.remove(os.path.join(SHARDS_DIRECTORY, fname))
+
+
+def load_index():
+    assert os.path.exists(INDEX_FILENAME), 'No %s; rerun xml-to-json.py to completion' % INDEX_FILENAME
+    index = {}
+    with open(INDEX_FILENAME) as f:
+        for line in f:
+            entry = json.loads(line)
+            index[entry['id']] = entry
+    return index
+
+
+def read_bugs(index, ids):
+    # Yields (id, gh) for each of the given ids, in the order given.
+    # Reading them in id order means reading each shard from front to back.
+    shard = None
+    f = None
+    try:
+        for id in ids:
+            entry = index[id]
+            if entry['shard'] != shard:
+                if f is not None:
+                    f.close()
+                shard = entry['shard']
+                f = open(os.path.join(SHARDS_DIRECTORY, shard), 'rb')
+            f.seek(entry['offset'])
+            yield id, decode_record(f.read(entry['length']), shard.endswith('.gz'))
+    finally:
+        if f is not None:
+            f.close()
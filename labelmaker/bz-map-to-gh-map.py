@@ -1,9 +1,28 @@
 #!/usr/bin/env python
 
+import os
 import re
-import requests
+import sqlite3
+import sys
 import time
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import httpclient  # noqa: E402
+import ratelimit  # noqa: E402
+
+# Neither llvm.org nor github.com advertises its rate limits for these
+# redirects, so start slowly and let the limiter find out.
+rate_limiter = ratelimit.AdaptiveRateLimiter(requests_per_second=1)
+client = httpclient.HttpClient(rate_limiter)
+
+LLVM_ORG_URL = os.environ.get('LLVM_ORG_URL', 'https://llvm.org')
+GITHUB_URL = os.environ.get('GITHUB_URL', 'https://github.com')
+
+# If you've built id-map.sqlite with json-to-id-map.py, set this to its path,
+# and bugs will be looked up there instead of by following redirects.
+# Any bug that isn't in it falls back to the redirects.
+ID_MAP_DATABASE = None
+
 
 bz_resolution_map = {
     "CONFIRMED": [
@@ -60,31 +79,44 @@ bz_resolution_map = {
 }
 
 
+def crawl_gh_id(bz_id):
+    r = client.get(
+        '%s/PR%d' % (LLVM_ORG_URL, bz_id),
+        allow_redirects=False,
+    )
+    assert r.status_code == 301
+    archive_url = r.headers['Location']
+    m = re.match(re.escape(GITHUB_URL) + r'/llvm/llvm-bugzilla-archive/issues/(\d+)', archive_url)
+    assert m
+    r = client.get(
+        archive_url,
+        allow_redirects=False,
+    )
+    assert r.status_code == 302
+    gh_url = r.headers['Location']
+    m = re.match(re.escape(GITHUB_URL) + r'/llvm/llvm-project/issues/(\d+)', gh_url)
+    assert m
+    gh_id = m.group(1)
+    return gh_id
+
+
 if __name__ == '__main__':
     gh_resolution_map = {}
+    id_map = {}
+    if ID_MAP_DATABASE is not None:
+        db = sqlite3.connect(ID_MAP_DATABASE)
+        id_map = {bz_id: str(gh_id) for bz_id, gh_id in db.execute('SELECT bz_id, gh_id FROM id_map')}
+        db.close()
     start_time = time.time()
     total = sum(len(ids) for ids in bz_resolution_map.values())
     processed = 0
     for key, bz_ids in bz_resolution_map.items():
         gh_ids = []
         for bz_id in bz_ids:
-            r = requests.get(
-                'https://llvm.org/PR%d' % bz_id,
-                allow_redirects=False,
-            )
-            assert r.status_code == 301
-            archive_url = r.headers['Location']
-            m = re.match(r'https://github.com/llvm/llvm-bugzilla-archive/issues/(\d+)', archive_url)
-            assert m
-            r = requests.get(
-                archive_url,
-                allow_redirects=False,
-            )
-            assert r.status_code == 302
-            gh_url = r.headers['Location']
-            m = re.match(r'https://github.com/llvm/llvm-project/issues/(\d+)', gh_url)
-            assert m
-            gh_id = m.group(1)
+            if bz_id in id_map:
+                gh_id = id_map[bz_id]
+            else:
+                gh_id = crawl_gh_id(bz_id)
             gh_ids.append(gh_id)
 
             processed += 1
@@ -106,3 +138,4 @@ if __name__ == '__main__':
                 print(' %s,' % gh_id, end='')
             print('\n    ],')
         print('}')
+    client.print_stats()
@@ -1,9 +1,13 @@
 #!/usr/bin/env python
 
 import os
-import requests
+import sys
 import time
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import httpclient  # noqa: E402
+import ratelimit  # noqa: E402
+
 # This script works as-is for public repos.
 # If your repository is private, then you'll need to generate a "Personal API Token"
 # from https://github.com/settings/tokens/new , including at least the "repo" permission
@@ -12,6 +16,10 @@ import time
 
 GITHUB_REPOSITORY_NAME = 'llvm/llvm-project'
 GITHUB_API_TOKEN = os.environ.get('GITHUB_API_TOKEN', None)
+GITHUB_API_URL = os.environ.get('GITHUB_API_URL', 'https://api.github.com')
+
+rate_limiter = ratelimit.AdaptiveRateLimiter(requests_per_second=1)
+client = httpclient.HttpClient(rate_limiter, headers=httpclient.github_headers(GITHUB_API_TOKEN))
 
 
 gh_resolution_map = {
@@ -75,14 +83,8 @@ if __name__ == '__main__':
     retrieved = 0
     open_issues = []
     while True:
-        headers = {
-            'User-Agent': 'Script from https://github.com/Quuxplusone/BugzillaToGithub',
-        }
-        if GITHUB_API_TOKEN is not None:
-            headers['Authorization'] = 'token %s' % GITHUB_API_TOKEN
-        r = requests.get(
-            'https://api.github.com/repos/%s/issues?state=open&page=%d&per_page=100' % (GITHUB_REPOSITORY_NAME, page + 1),
-            headers=headers,
+        r = client.get(
+            '%s/repos/%s/issues?state=open&page=%d&per_page=100' % (GITHUB_API_URL, GITHUB_REPOSITORY_NAME, page + 1),
         )
         bugs = r.json()
         if type(bugs) is not list:
@@ -102,6 +104,7 @@ if __name__ == '__main__':
         retrieved += len(bugs)
         elapsed = time.time() - start_time
         print('Retrieved %d pages containing %d bugs in %.2fs; ???s remaining' % (page, retrieved, elapsed))
+    client.print_stats()
 
     issues_to_mark_confirmed = sorted(set(gh_resolution_map['CONFIRMED']) & set(open_issues))
     print('issues_to_mark_confirmed = [', end='')
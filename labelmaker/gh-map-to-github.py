@@ -3,9 +3,13 @@
 import json
 import os
 import re
-import requests
+import sys
 import time
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import httpclient  # noqa: E402
+import ratelimit  # noqa: E402
+
 
 # This script makes irreversible changes to a GitHub repository!
 # Therefore, you'll need to generate a "Personal API Token"
@@ -17,6 +21,10 @@ import time
 
 GITHUB_REPOSITORY_NAME = 'llvm/llvm-project'
 GITHUB_API_TOKEN = os.environ['GITHUB_API_TOKEN']
+GITHUB_API_URL = os.environ.get('GITHUB_API_URL', 'https://api.github.com')
+
+rate_limiter = ratelimit.AdaptiveRateLimiter(requests_per_second=1)
+client = httpclient.HttpClient(rate_limiter, headers=httpclient.github_headers(GITHUB_API_TOKEN))
 
 
 issues_to_mark_confirmed = [
@@ -74,11 +82,9 @@ def submit_github_label(gh_id, labelname):
     assert re.match(r'[A-Za-z0-9_-]+/[A-Za-z0-9_-]+', GITHUB_REPOSITORY_NAME)
     assert type(gh_id) is int
     assert re.match(r'[a-z]+', labelname)
-    r = requests.post(
-        'https://api.github.com/repos/%s/issues/%d/labels' % (GITHUB_REPOSITORY_NAME, gh_id),
-        headers={
-            'Authorization': 'token %s' % GITHUB_API_TOKEN,
-        },
+    # Adding a label that's already there is harmless, so this is safe to retry.
+    r = client.post(
+        '%s/repos/%s/issues/%d/labels' % (GITHUB_API_URL, GITHUB_REPOSITORY_NAME, gh_id),
         data=json.dumps({
             'labels': [labelname]
         }),
@@ -99,3 +105,4 @@ if __name__ == '__main__':
         elapsed = time.time() - start_time
         remaining = elapsed * (total - processed) / processed
         print('Processed %d of %d bugs in %.2fs; %ds remaining' % (processed, total, elapsed, remaining))
+    client.print_stats()
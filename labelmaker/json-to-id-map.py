@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+
+import glob
+import json
+import os
+import re
+import sqlite3
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import corpus  # noqa: E402
+
+# bz-map-to-gh-map.py used to find each bug's GitHub issue number by
+# following two HTTP redirects per bug (llvm.org/PR1234, then the
+# llvm-bugzilla-archive issue). That's a couple of thousand round trips
+# just for the CONFIRMED bugs, and as many again for every new map.
+# Instead, this script reads a bulk export of the GitHub repository
+# (the github-json/ directory made by ../github-to-json.py), finds the
+# "Bugzilla Link" row that each migrated issue's summary table starts with,
+# and saves the whole mapping in an SQLite table keyed by Bugzilla ID,
+# so that any map of any size translates locally.
+
+ID_MAP_DATABASE = 'id-map.sqlite'
+
+BUGZILLA_LINK_RX = re.compile(r'^\| *Bugzilla Link *\| *\[[^\]]*\]\(([^)]*)\)', re.MULTILINE)
+BUGZILLA_URL_RX = re.compile(r'(?:show_bug\.cgi\?id=|/bz|/PR)([0-9]+)$')
+
+
+def assert_github_issue(gh, gh_id):
+    # json/ holds xml-to-json.py's files, which look much the same, and whose
+    # bodies start with the same "Bugzilla Link" row; but they're named by
+    # Bugzilla ID, so mapping from them would map every bug to itself.
+    issue = gh.get('issue', {})
+    assert ('node_id' in issue) and (issue.get('number') == gh_id), (
+        'ERROR -- github-json/%d.json is not issue #%d as exported by github-to-json.py' % (gh_id, gh_id)
+    )
+
+
+def extract_bugzilla_id(body):
+    link = BUGZILLA_LINK_RX.search(body or '')
+    if link is None:
+        return None
+    m = BUGZILLA_URL_RX.search(link.group(1))
+    assert m, 'Unexpected Bugzilla link %s' % link.group(1)
+    return int(m.group(1))
+
+
+if __name__ == '__main__':
+    all_json_filenames = glob.glob('github-json/*.json')
+    all_github_ids = sorted([corpus.extract_id(fname, 'github-json', 'json') for fname in all_json_filenames])
+    id_map = {}
+    for gh_id in all_github_ids:
+        with open('github-json/%d.json' % gh_id) as f:
+            gh = json.load(f)
+        assert_github_issue(gh, gh_id)
+        bz_id = extract_bugzilla_id(gh['issue']['body'])
+        if bz_id is None:
+            continue
+        if bz_id in id_map:
+            # Keep the first (oldest) issue; a later one is presumably a re-import.
+            print('WARNING -- Bugzilla bug %d is linked from both #%d and #%d; keeping #%d' % (bz_id, id_map[bz_id], gh_id, id_map[bz_id]))
+            continue
+        id_map[bz_id] = gh_id
+
+    db = sqlite3.connect(ID_MAP_DATABASE)
+    db.execute('DROP TABLE IF EXISTS id_map')
+    db.execute('CREATE TABLE id_map (bz_id INTEGER PRIMARY KEY, gh_id INTEGER NOT NULL) WITHOUT ROWID')
+    db.executemany('INSERT INTO id_map VALUES (?, ?)', sorted(id_map.items()))
+    db.commit()
+    db.close()
+    print('Mapped %d Bugzilla bugs to GitHub issues, out of %d issues in github-json/' % (len(id_map), len(all_github_ids)))
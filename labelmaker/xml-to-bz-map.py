@@ -1,42 +1,58 @@
 #!/usr/bin/env python
 
 import collections
-import glob
-import re
-import xmltodict
+import os
+import sqlite3
+import sys
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import corpus  # noqa: E402
+
+# If you've run ../xml-to-sqlite.py, set this to the database it made
+# (e.g. 'bugs.sqlite'), and we'll ask it instead of parsing all of xml/.
+BUGS_DATABASE = None
 
 bz_resolution_map = collections.defaultdict(list)
 
 
-def bugzilla_to_github(id, bz):
+def confirmed_bug_id(bug):
+    # bug['bug_id'] if the bug is CONFIRMED, else None.
     # If you did Step 1 without valid Bugzilla credentials, '@exporter' will be missing.
+    bz = bug.parse()
     assert sorted(bz.keys()) == ['bugzilla']
     assert sorted(bz['bugzilla'].keys()) == ['@exporter', '@maintainer', '@urlbase', '@version', 'bug']
-    bz = bz['bugzilla']['bug']
-    assert bz['bug_id'] == str(id)
-    assert bz['bug_id'] == str(int(bz['bug_id']))
-    if bz['bug_status'] == 'CONFIRMED':
-        assert bz['everconfirmed'] == '1'
-        bz_resolution_map['CONFIRMED'] += [bz['bug_id']]
+    assert bug['bug_id'] == str(bug.id)
+    assert bug['bug_id'] == str(int(bug['bug_id']))
+    if bug['bug_status'] == 'CONFIRMED':
+        assert bug['everconfirmed'] == '1'
+        return bug['bug_id']
+    return None
+
+
+class ConfirmedBugFinder(corpus.Visitor):
+    fields = frozenset(['bug_id', 'bug_status', 'everconfirmed'])
+
+    def visit(self, bug):
+        return confirmed_bug_id(bug)
+
+    def collect(self, id, bug_id):
+        if bug_id is not None:
+            bz_resolution_map['CONFIRMED'] += [bug_id]
 
 
-def extract_id(fname):
-    m = re.match(r'xml/([0-9]+).xml', fname)
-    assert m, 'Unexpected filename %s in xml/ subdirectory' % fname
-    return int(m.group(1))
+def query_database(fname):
+    db = sqlite3.connect(fname)
+    for id, everconfirmed in db.execute("SELECT id, everconfirmed FROM bugs WHERE status = 'CONFIRMED' ORDER BY id"):
+        assert everconfirmed == '1'
+        bz_resolution_map['CONFIRMED'] += [str(id)]
+    db.close()
 
 
 if __name__ == '__main__':
-    all_xml_filenames = glob.glob('xml/*.xml')
-    all_bugzilla_ids = sorted([extract_id(fname) for fname in all_xml_filenames])
-    for id in all_bugzilla_ids:
-        print('Parsing %d.xml' % id)
-        with open('xml/%d.xml' % id) as f:
-            xml = f.read()
-        xml = xml.replace('\0', '')  # e.g. bug 26078
-        bz = xmltodict.parse(xml)
-        bugzilla_to_github(id, bz)
+    if BUGS_DATABASE is not None:
+        query_database(BUGS_DATABASE)
+    else:
+        corpus.walk([ConfirmedBugFinder()])
     print('\n\nbz_resolution_map = {')
     for key in bz_resolution_map.keys():
         print('    "%s": [' % key, end='')
@@ -0,0 +1,147 @@
+# Shared by all the scripts that talk to Bugzilla or GitHub over HTTP.
+#
+# A long run (17 hours for json-to-github.py!) shouldn't die because of
+# a single 502 or a "You have exceeded a secondary rate limit" 403.
+# AdaptiveRateLimiter paces requests using AIMD, the same scheme TCP uses
+# for congestion control: every success nudges the request rate up a little
+# (additive increase), and every throttling or server error halves it
+# (multiplicative decrease) and retries after a pause. So a script settles
+# in just under whatever rate the server is willing to sustain.
+# Where the server tells us its limits outright (Retry-After, and GitHub's
+# X-RateLimit-Remaining/X-RateLimit-Reset), we obey those instead of guessing.
+#
+# Usage:
+#     limiter = ratelimit.AdaptiveRateLimiter(requests_per_second=1)
+#     r = limiter.request(requests.get, url, headers=headers)
+#
+# The response returned is the first one that wasn't retryable (or the last
+# attempt's), so callers should still check r.status_code as before.
+
+import email.utils
+import requests
+import threading
+import time
+
+
+class AdaptiveRateLimiter:
+    def __init__(
+        self,
+        requests_per_second=1.0,
+        min_requests_per_second=0.02,
+        max_requests_per_second=50.0,
+        increase=0.1,
+        decrease=0.5,
+        max_attempts=10,
+    ):
+        self.rate = requests_per_second
+        self.min_rate = min_requests_per_second
+        self.max_rate = max_requests_per_second
+        self.increase = increase
+        self.decrease = decrease
+        self.max_attempts = max_attempts
+        self.lock = threading.Lock()
+        self.next_slot = time.monotonic()
+        self.paused_until = 0.0
+
+    def wait(self):
+        # Claim the next free time slot, then sleep until it arrives.
+        # Slots are spaced 1/rate apart, so several threads sharing one
+        # limiter still make at most `rate` requests per second between them.
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot, self.paused_until)
+            self.next_slot = slot + 1.0 / self.rate
+        if slot > now:
+            time.sleep(slot - now)
+
+    def pause(self, seconds, why):
+        with self.lock:
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        print('%s; pausing %.1fs and slowing to %.2f requests/s' % (why, seconds, self.rate))
+
+    def succeed(self, r):
+        with self.lock:
+            # Additive increase: about `increase` more requests per second,
+            # for every second's worth of successful requests.
+            self.rate = min(self.max_rate, self.rate + self.increase / self.rate)
+            remaining, reset = rate_limit_budget(r)
+            if remaining is not None:
+                # Spread what's left of the primary rate limit evenly over the
+                # rest of its window, so we never run it all the way down to zero.
+                self.rate = max(self.min_rate, min(self.rate, remaining / max(reset - time.time(), 1.0)))
+
+    def request(self, send, *args, retry_server_errors=True, **kwargs):
+        # Pass retry_server_errors=False for requests that aren't safe to repeat
+        # (e.g. creating an issue): a 502 doesn't prove the server didn't act on it.
+        # Being throttled does prove that, so those are always retried.
+        for attempt in range(1, self.max_attempts + 1):
+            self.wait()
+            try:
+                r = send(*args, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as ex:
+                if (attempt == self.max_attempts) or not retry_server_errors:
+                    raise
+                self.pause(backoff_seconds(attempt), 'Request failed (%s)' % type(ex).__name__)
+                continue
+            throttled = is_throttled(r)
+            if not throttled and not (retry_server_errors and (r.status_code in [500, 502, 503, 504])):
+                self.succeed(r)
+                return r
+            if attempt == self.max_attempts:
+                return r
+            if throttled:
+                self.pause(throttled_seconds(r, attempt), 'HTTP %d, rate limited' % r.status_code)
+            else:
+                self.pause(retry_after_seconds(r) or backoff_seconds(attempt), 'HTTP %d' % r.status_code)
+            r.close()
+
+
+def is_throttled(r):
+    if r.status_code == 429:
+        return True
+    if r.status_code == 403:
+        # GitHub reports both primary and secondary rate limits as 403,
+        # which otherwise means "permission denied" and isn't worth retrying.
+        return (
+            ('Retry-After' in r.headers) or
+            (r.headers.get('X-RateLimit-Remaining') == '0') or
+            ('rate limit' in r.text)
+        )
+    return False
+
+
+def rate_limit_budget(r):
+    try:
+        return int(r.headers['X-RateLimit-Remaining']), int(r.headers['X-RateLimit-Reset'])
+    except (KeyError, ValueError):
+        return None, None
+
+
+def retry_after_seconds(r):
+    value = r.headers.get('Retry-After')
+    if value is None:
+        return None
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_seconds(attempt):
+    return min(2.0 ** attempt, 300.0)
+
+
+def throttled_seconds(r, attempt):
+    seconds = retry_after_seconds(r)
+    if seconds is not None:
+        return seconds
+    remaining, reset = rate_limit_budget(r)
+    if remaining == 0:
+        # The primary rate limit is exhausted; nothing will work until it resets.
+        return max(1.0, reset - time.time())
+    # GitHub's docs say to wait at least a minute after a secondary rate limit
+    # that doesn't come with a Retry-After.
+    return max(60.0, backoff_seconds(attempt))
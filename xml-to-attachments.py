@@ -0,0 +1,288 @@
+#!/usr/bin/env python
+
+import base64
+import concurrent.futures
+import glob
+import hashlib
+import httpclient
+import json
+import os
+import ratelimit
+import re
+import time
+
+# This script collects the bodies of all the attachments mentioned in xml/
+# into a content-addressed store under attachments/: each distinct body is
+# stored once, as attachments/sha256/<first two hex digits>/<full hex digest>,
+# and attachments/index.jsonl maps each attachid to its digest.
+#
+# If your XML files still have the attachments inlined as base64 (that is,
+# you ran bugzilla-to-xml.py without EXCLUDE_ATTACHMENT_DATA), this script
+# moves each <data> payload into the store, decoding it a chunk at a time,
+# and rewrites the XML file without it.
+#
+# Any attachments still missing from the store are then fetched, one
+# attachment.cgi request per attachment. Private attachments need the same
+# BUGZILLA_LOGIN and BUGZILLA_LOGINCOOKIE as bugzilla-to-xml.py.
+# Do not publish your BUGZILLA_LOGINCOOKIE! Do not push it to GitHub!
+
+BUGZILLA_LOGIN = os.environ.get('BUGZILLA_LOGIN', None)
+BUGZILLA_LOGINCOOKIE = os.environ.get('BUGZILLA_LOGINCOOKIE', None)
+BUGZILLA_URL = os.environ.get('BUGZILLA_URL', 'https://bugs.llvm.org')
+MAX_IN_FLIGHT_REQUESTS = 8
+FETCH_MISSING_ATTACHMENTS = True
+
+DATA_START_TAG = b'<data encoding="base64">'
+DATA_END_TAG = b'</data>'
+CHUNK_SIZE = 65536
+
+rate_limiter = ratelimit.AdaptiveRateLimiter(requests_per_second=4)
+
+
+def make_client():
+    assert (BUGZILLA_LOGIN is None) == (BUGZILLA_LOGINCOOKIE is None)
+    cookies = None
+    if BUGZILLA_LOGIN is not None:
+        cookies = {
+            'Bugzilla_login': BUGZILLA_LOGIN,
+            'Bugzilla_logincookie': BUGZILLA_LOGINCOOKIE,
+        }
+    return httpclient.HttpClient(rate_limiter, cookies=cookies, max_connections_per_host=MAX_IN_FLIGHT_REQUESTS)
+
+
+def fsync_directory(dirname):
+    # Makes the files just created or renamed in dirname survive a crash.
+    fd = os.open(dirname, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class BlobWriter:
+    # Accumulates one attachment body into a temporary file, hashing it as
+    # it goes; finish() fsyncs it and moves it to its content-addressed name,
+    # or throws it away if the store already has a blob with that digest.
+    # For some attachments, the XML file holds the only other copy, and it's
+    # about to be rewritten without it; so the blob must be on disk first.
+    def __init__(self):
+        self.tmpname = 'attachments/tmp-%d-%d' % (os.getpid(), id(self))
+        self.f = open(self.tmpname, 'wb')
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data):
+        self.f.write(data)
+        self.sha256.update(data)
+        self.size += len(data)
+
+    def finish(self):
+        self.f.flush()
+        os.fsync(self.f.fileno())
+        self.f.close()
+        digest = self.sha256.hexdigest()
+        dirname = 'attachments/sha256/%s' % digest[:2]
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname, exist_ok=True)
+            fsync_directory('attachments/sha256')
+        blobname = '%s/%s' % (dirname, digest)
+        if os.path.exists(blobname):
+            os.remove(self.tmpname)
+        else:
+            os.replace(self.tmpname, blobname)
+            fsync_directory(dirname)
+        return {'sha256': digest, 'size': self.size}
+
+    def abandon(self):
+        self.f.close()
+        os.remove(self.tmpname)
+
+
+class Base64Decoder:
+    # base64 decodes in groups of 4 characters; hold back any leftover
+    # characters until the next chunk arrives.
+    def __init__(self, out):
+        self.out = out
+        self.pending = b''
+
+    def feed(self, text):
+        text = self.pending + re.sub(rb'\s+', b'', text)
+        n = len(text) - (len(text) % 4)
+        self.out.write(base64.b64decode(text[:n]))
+        self.pending = text[n:]
+
+    def finish(self):
+        assert self.pending == b'', 'Truncated base64 data'
+
+
+def read_chunks(f):
+    while True:
+        chunk = f.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        yield chunk
+
+
+def contains_attachment_data(fname):
+    with open(fname, 'rb') as f:
+        tail = b''
+        for chunk in read_chunks(f):
+            text = tail + chunk
+            if DATA_START_TAG in text:
+                return True
+            tail = text[-len(DATA_START_TAG):]
+    return False
+
+
+def extract_attachment_data(fname):
+    # Copy fname to fname + '.tmp' (and fsync it), except that each <data>
+    # element is decoded into the blob store instead. Returns a list of
+    # index records.
+    # The caller must record them in the index before replacing fname with
+    # the copy; otherwise a crash would leave blobs that nothing points to.
+    records = []
+    attachid = None
+    recent = b''
+    with open(fname, 'rb') as f, open(fname + '.tmp', 'wb') as out:
+
+        def copy_through(text):
+            # Remember the most recent <attachid>; it precedes its <data>.
+            # We search a little of the previously copied text too, in case
+            # the tag straddles two chunks.
+            nonlocal attachid, recent
+            for m in re.finditer(rb'<attachid>([0-9]+)</attachid>', recent + text):
+                attachid = int(m.group(1))
+            recent = (recent + text)[-64:]
+            out.write(text)
+
+        buf = bytearray()
+        blob = None
+        decoder = None
+        eof = False
+        while True:
+            if blob is None:
+                i = buf.find(DATA_START_TAG)
+                if i != -1:
+                    # Drop the <data> element's indentation along with it.
+                    before = bytes(buf[:i]).rstrip(b' \t')
+                    copy_through(before[:-1] if before.endswith(b'\n') else before)
+                    del buf[:i + len(DATA_START_TAG)]
+                    assert attachid is not None, 'Found <data> before any <attachid> in %s' % fname
+                    blob = BlobWriter()
+                    decoder = Base64Decoder(blob)
+                    continue
+                if eof:
+                    copy_through(bytes(buf))
+                    break
+                # Hold back enough to recognize a start tag split across chunks,
+                # and any trailing whitespace that might turn out to be its indentation.
+                n = len(bytes(buf[:len(buf) - len(DATA_START_TAG) + 1]).rstrip(b' \t\n'))
+                copy_through(bytes(buf[:n]))
+                del buf[:n]
+            else:
+                # base64 never contains '<', so the first '<' starts </data>.
+                j = buf.find(b'<')
+                if j != -1 and len(buf) - j >= len(DATA_END_TAG):
+                    assert buf[j:j + len(DATA_END_TAG)] == DATA_END_TAG, 'Malformed <data> in %s' % fname
+                    decoder.feed(bytes(buf[:j]))
+                    decoder.finish()
+                    del buf[:j + len(DATA_END_TAG)]
+                    records.append(dict(attachid=attachid, **blob.finish()))
+                    blob = None
+                    continue
+                assert not eof, 'Unterminated <data> in %s' % fname
+                if j == -1:
+                    decoder.feed(bytes(buf))
+                    del buf[:]
+            if not eof:
+                chunk = f.read(CHUNK_SIZE)
+                eof = not chunk
+                buf += chunk
+        out.flush()
+        os.fsync(out.fileno())
+    return records
+
+
+def fetch_attachment(client, attachid):
+    with client.get('%s/attachment.cgi?id=%d' % (BUGZILLA_URL, attachid), stream=True) as r:
+        assert r.status_code == 200, 'Unexpected HTTP %d response for attachment %d' % (r.status_code, attachid)
+        blob = BlobWriter()
+        try:
+            for chunk in r.iter_content(chunk_size=CHUNK_SIZE):
+                blob.write(chunk)
+        except BaseException:
+            blob.abandon()
+            raise
+    return dict(attachid=attachid, **blob.finish())
+
+
+def extract_attachment_ids(fname):
+    with open(fname, 'rb') as f:
+        xml = f.read()
+    return [int(attachid) for attachid in re.findall(rb'<attachid>([0-9]+)</attachid>', xml)]
+
+
+def load_index():
+    index = {}
+    if os.path.exists('attachments/index.jsonl'):
+        with open('attachments/index.jsonl') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # The last line may be truncated if we were killed while writing it.
+                    continue
+                index[record['attachid']] = record
+    return index
+
+
+if __name__ == '__main__':
+    os.makedirs('attachments/sha256', exist_ok=True)
+    index = load_index()
+    with open('attachments/index.jsonl', 'a') as index_file:
+        fsync_directory('attachments')
+        all_xml_filenames = sorted(glob.glob('xml/*.xml'))
+        start_time = time.time()
+        processed = 0
+        extracted = 0
+        for fname in all_xml_filenames:
+            if contains_attachment_data(fname):
+                for record in extract_attachment_data(fname):
+                    print(json.dumps(record), file=index_file)
+                    index[record['attachid']] = record
+                    extracted += 1
+                index_file.flush()
+                os.fsync(index_file.fileno())
+                os.replace(fname + '.tmp', fname)
+                fsync_directory('xml')
+            processed += 1
+            if processed % 100 == 0:
+                elapsed = time.time() - start_time
+                remaining = elapsed * (len(all_xml_filenames) - processed) / processed
+                print('Extracted %d attachments from %d files in %.2fs; %ds remaining' % (extracted, processed, elapsed, remaining))
+
+        if FETCH_MISSING_ATTACHMENTS:
+            client = make_client()
+            all_attachment_ids = sorted(
+                attachid
+                for fname in all_xml_filenames
+                for attachid in extract_attachment_ids(fname)
+                if attachid not in index
+            )
+            start_time = time.time()
+            processed = 0
+            with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_IN_FLIGHT_REQUESTS) as executor:
+                futures = [executor.submit(fetch_attachment, client, attachid) for attachid in all_attachment_ids]
+                try:
+                    for future in concurrent.futures.as_completed(futures):
+                        record = future.result()
+                        print(json.dumps(record), file=index_file)
+                        index_file.flush()
+                        processed += 1
+                        elapsed = time.time() - start_time
+                        remaining = elapsed * (len(all_attachment_ids) - processed) / processed
+                        print('Retrieved attachment %d (%d of %d) in %.2fs; %ds remaining' % (record['attachid'], processed, len(all_attachment_ids), elapsed, remaining))
+                except BaseException:
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    raise
+            client.print_stats()
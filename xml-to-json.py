@@ -1,13 +1,43 @@
 #!/usr/bin/env python
 
+import bzreader
+import corpus
 import datetime
 import dateutil.parser
-import glob
+import functools
+import hashlib
+import importlib
 import json
+import jsonshards
 import os
 import re
-import time
-import xmltodict
+
+# Each bug converts independently of all the others, so we can fan them out
+# over a pool of worker processes. The output is identical either way.
+JOBS = os.cpu_count()
+BUGS_PER_TASK = 64
+
+# Every json/<id>.json we write is recorded in this manifest, along with
+# the SHA-256 of the XML it came from, of the converter that converted it
+# (that is, the source of this script, bzreader.py and corpus.py, and the
+# version of dateutil), and of the JSON itself. A rerun reconverts only the
+# bugs whose XML or converter changed, so tweaking markdownify and rerunning
+# takes seconds, not minutes. Records are appended as we go, and the whole
+# manifest is rewritten, one line per bug, at the end of each run.
+# To force a full rebuild, delete the manifest.
+MANIFEST_FILENAME = 'json-manifest.jsonl'
+CONVERTER_SOURCES = [__file__, bzreader.__file__, corpus.__file__]
+
+# Instead of json/<id>.json, write compact newline-delimited JSON into
+# json-shards/, in shards of at most SHARD_MAX_BYTES each (see jsonshards.py).
+# The shards are always rewritten from scratch; the manifest isn't used.
+WRITE_NDJSON_SHARDS = False
+SHARD_MAX_BYTES = 64 * 1024 * 1024
+COMPRESS_SHARDS = False
+
+# Also bring bugs.sqlite up to date (see xml-to-sqlite.py) in the same pass
+# over xml/, rather than parsing every file all over again afterward.
+ALSO_UPDATE_SQLITE_INDEX = False
 
 
 def link_to_original_bugzilla_bug(bugzilla_id, text=None):
@@ -37,108 +67,87 @@ def link_to_differential(differential_id, text=None):
     return '[%s](https://reviews.llvm.org/D%s)' % (text, differential_id)
 
 
-def replace_all_in_string(text, rx, how):
-    rx = re.compile(rx)
-    pos = 0
-    while True:
-        m = rx.search(text, pos)
-        if m is None:
-            break
-        suffix = text[m.end(1):]
-        text = text[:m.start(1)] + how(m) + suffix
-        pos = len(text) - len(suffix)
-    return text
+# Every kind of reference we turn into a link, in one table so that
+# link_to_mentioned_bugs_and_commits can find them all in a single scan.
+# Each pattern matches exactly the text to be replaced; those that need
+# a particular character before them say so with a lookbehind.
+# These used to be nine separate search-and-replace passes, in this order;
+# none of them can match inside another's output, so one pass is equivalent.
+MENTIONED_REFERENCES = [
+    (r'\brevision [0-9]{4,5}\b', lambda s: link_to_svn_commit(s[9:], s)),
+    (r'\bcommit [0-9a-f]{7,40}\b', lambda s: link_to_git_commit(s[7:], s)),
+    (r'\b[Bb]ug [0-9]{2,5}\b', lambda s: link_to_pr(s[4:], s)),
+    # TODO FIXME BUG HACK: s[12:] is always empty here, so these links
+    # go to "show_bug.cgi?id=". Preserved so that the output doesn't change.
+    (r'(?<=uplicate of )[0-9]{2,5}\b', lambda s: link_to_pr(s[12:], s)),
+    (r'(?<=[^_A-Za-z0-9/])PR[0-9]{3,5}\b', lambda s: link_to_pr(s[2:], s)),
+    (r'(?<=[^_A-Za-z0-9/])rL[123][0-9]{5}\b', lambda s: link_to_svn_commit(s[2:], s)),
+    (r'(?<=[^_A-Za-z0-9/])r[123][0-9]{5}\b', lambda s: link_to_svn_commit(s[1:], s)),
+    (r'(?<=[^_A-Za-z0-9/])rG[0-9a-f]{7,40}\b', lambda s: link_to_git_commit(s[2:], s)),
+    (r'(?<=[^_A-Za-z0-9/])D[0-9]{4,6}\b', lambda s: link_to_differential(s[1:], s)),
+]
+
+
+def compile_references(references):
+    rx = re.compile('|'.join(['(%s)' % pattern for pattern, how in references]))
+    hows = [None] + [how for pattern, how in references]
+    return rx, (lambda m: hows[m.lastindex](m.group()))
+
+
+# Every reference contains a digit, except for git hashes, which are
+# always introduced by "commit " or "rG". Most text has none of these
+# anywhere, and can skip the much more expensive scan.
+REFERENCE_CANDIDATE_RX = re.compile(r'[0-9]|commit |rG')
+MENTIONED_REFERENCES_RX, link_mentioned_reference = compile_references(MENTIONED_REFERENCES)
+AUTOCOMMENT_REFERENCES_RX, link_autocomment_reference = compile_references(MENTIONED_REFERENCES[2:4])
 
 
 def link_to_mentioned_bugs_and_commits(text):
     # This is where we should deal with comments such as
     # "Duplicate of bug 21377" or "I reverted this in r254044 because PR25607."
     # TODO FIXME BUG HACK: This could still be improved.
-    text = replace_all_in_string(
-        text,
-        r'\b(revision [0-9]{4,5})\b',
-        lambda m: link_to_svn_commit(m.group(1)[9:], m.group(1))
-    )
-    text = replace_all_in_string(
-        text,
-        r'\b(commit [0-9a-f]{7,40})\b',
-        lambda m: link_to_git_commit(m.group(1)[7:], m.group(1))
-    )
-    text = replace_all_in_string(
-        text,
-        r'\b([Bb]ug [0-9]{2,5})\b',
-        lambda m: link_to_pr(m.group(1)[4:], m.group(1))
-    )
-    text = replace_all_in_string(
-        text,
-        r'uplicate of ([0-9]{2,5})\b',
-        lambda m: link_to_pr(m.group(1)[12:], m.group(1))
-    )
-    text = replace_all_in_string(
-        text,
-        r'[^_A-Za-z0-9/](PR[0-9]{3,5})\b',
-        lambda m: link_to_pr(m.group(1)[2:], m.group(1))
-    )
-    text = replace_all_in_string(
-        text,
-        r'[^_A-Za-z0-9/](rL[123][0-9]{5})\b',
-        lambda m: link_to_svn_commit(m.group(1)[2:], m.group(1))
-    )
-    text = replace_all_in_string(
-        text,
-        r'[^_A-Za-z0-9/](r[123][0-9]{5})\b',
-        lambda m: link_to_svn_commit(m.group(1)[1:], m.group(1))
-    )
-    text = replace_all_in_string(
-        text,
-        r'[^_A-Za-z0-9/](rG[0-9a-f]{7,40})\b',
-        lambda m: link_to_git_commit(m.group(1)[2:], m.group(1))
-    )
-    text = replace_all_in_string(
-        text,
-        r'[^_A-Za-z0-9/](D[0-9]{4,6})\b',
-        lambda m: link_to_differential(m.group(1)[1:], m.group(1))
-    )
-    return text
+    if REFERENCE_CANDIDATE_RX.search(text) is None:
+        return text
+    return MENTIONED_REFERENCES_RX.sub(link_mentioned_reference, text)
 
 
 def link_to_mentioned_bugs_in_bugzilla_autocomment(text):
     # See detect_bugzilla_autocomment. The only kinds of autocomments
     # we support are the ones where every integer is a bug number.
-    text = replace_all_in_string(
-        text,
-        r'\b([Bb]ug [0-9]{2,5})\b',
-        lambda m: link_to_pr(m.group(1)[4:], m.group(1))
-    )
-    text = replace_all_in_string(
-        text,
-        r'uplicate of ([0-9]{2,5})\b',
-        lambda m: link_to_pr(m.group(1)[12:], m.group(1))
-    )
-    return text
+    if REFERENCE_CANDIDATE_RX.search(text) is None:
+        return text
+    return AUTOCOMMENT_REFERENCES_RX.sub(link_autocomment_reference, text)
 
 
 def wrap_long_line(line):
     # Bugzilla breaks lines around 84 columns; we choose 80.
+    # This walks an index along the line rather than recursing on what's
+    # left of it, so a multi-megabyte pasted log line takes linear time.
     line = line.rstrip()
-    if (len(line) <= 80) or (' ' not in line) or (line[0] == ' '):
-        # Don't wrap lines that look like probably source code.
-        return line
-    lastspace = line.rfind(' ', 0, 80)
-    lasthyphen = line.rfind('-', 0, 80)
-    if lastspace > lasthyphen:
-        return line[:lastspace].rstrip() + '\n' + wrap_long_line(line[lastspace:].lstrip())
-    elif lasthyphen > lastspace:
-        return line[:lasthyphen+1] + '\n' + wrap_long_line(line[lasthyphen+1:])
-    else:
-        assert lastspace == -1 and lasthyphen == -1
-        lastspace = line.find(' ', 80)
-        lasthyphen = line.find('-', 80)
-        assert lastspace != -1
-        if lasthyphen != -1 and lasthyphen < lastspace:
-            return line[:lasthyphen+1] + '\n' + wrap_long_line(line[lasthyphen+1:])
+    finalspace = line.rfind(' ')
+    pieces = []
+    start = 0
+    # Don't wrap lines that look like probably source code.
+    while (len(line) - start > 80) and (finalspace >= start) and (line[start] != ' '):
+        lastspace = line.rfind(' ', start, start + 80)
+        lasthyphen = line.rfind('-', start, start + 80)
+        if lastspace != lasthyphen:
+            break_at_hyphen = (lasthyphen > lastspace)
         else:
-            return line[:lastspace].rstrip() + '\n' + wrap_long_line(line[lastspace:].lstrip())
+            assert lastspace == -1 and lasthyphen == -1
+            lastspace = line.find(' ', start + 80)
+            lasthyphen = line.find('-', start + 80, lastspace)
+            break_at_hyphen = (lasthyphen != -1)
+        if break_at_hyphen:
+            pieces.append(line[start:lasthyphen+1])
+            start = lasthyphen + 1
+        else:
+            pieces.append(line[start:lastspace].rstrip())
+            start = lastspace + 1
+            while line[start].isspace():
+                start += 1
+    pieces.append(line[start:])
+    return '\n'.join(pieces)
 
 
 def wrap_long_lines(text):
@@ -178,47 +187,46 @@ def markdownify(text):
     return link_to_mentioned_bugs_and_commits(text)
 
 
+PR_LINK_RXS = [
+    re.compile(r'^([0-9]+)$'),
+    re.compile(r'^PR([0-9]+)$'),
+    re.compile(r'^https://bugs.llvm.org//show_bug.cgi[?]id=([0-9]+)$'),
+    re.compile(r'^https://bugs.llvm.org/show_bug.cgi[?]id=([0-9]+)$'),
+    re.compile(r'^http://bugs.llvm.org/show_bug.cgi[?]id=([0-9]+)$'),
+    re.compile(r'^https://llvm.org/bugs/show_bug.cgi[?]id=([0-9]+)$'),
+    re.compile(r'^http://llvm.org/bugs/show_bug.cgi[?]id=([0-9]+)$'),
+]
+
+
 def link_to_pr_if_possible(s):
-    m = (
-        re.match(r'^([0-9]+)$', s) or
-        re.match(r'^PR([0-9]+)$', s) or
-        re.match(r'^https://bugs.llvm.org//show_bug.cgi[?]id=([0-9]+)$', s) or
-        re.match(r'^https://bugs.llvm.org/show_bug.cgi[?]id=([0-9]+)$', s) or
-        re.match(r'^http://bugs.llvm.org/show_bug.cgi[?]id=([0-9]+)$', s) or
-        re.match(r'^https://llvm.org/bugs/show_bug.cgi[?]id=([0-9]+)$', s) or
-        re.match(r'^http://llvm.org/bugs/show_bug.cgi[?]id=([0-9]+)$', s) or
-        None
-    )
-    if m is not None:
-        return link_to_pr(m.group(1))
+    for rx in PR_LINK_RXS:
+        m = rx.match(s)
+        if m:
+            return link_to_pr(m.group(1))
     # I've manually verified that all these external links look reasonable.
     assert s.startswith('http') and ('llvm' not in s), s
     return markdownify(s)
 
 
+COMMIT_LINK_RXS = [
+    (re.compile(r'^r?([123][0-9]{5})$'), link_to_svn_commit),
+    (re.compile(r'^rL([123][0-9]{4,5})$'), link_to_svn_commit),
+    (re.compile(r'^https://reviews.llvm.org/rL([123][0-9]{4,5})$'), link_to_svn_commit),
+    (re.compile(r'^([0-9a-f]+)$'), link_to_git_commit),
+    (re.compile(r'^rG([0-9a-f]+)$'), link_to_git_commit),
+    (re.compile(r'^https://reviews.llvm.org/rG([0-9a-f]+)$'), link_to_git_commit),
+]
+
+
 def link_to_commit_if_possible(s):
-    m = re.match(r'^r?([123][0-9]{5})$', s)
-    if m:
-        return link_to_svn_commit(m.group(1))
-    m = re.match(r'^rL([123][0-9]{4,5})$', s)
-    if m:
-        return link_to_svn_commit(m.group(1))
-    m = re.match(r'^https://reviews.llvm.org/rL([123][0-9]{4,5})$', s)
-    if m:
-        return link_to_svn_commit(m.group(1))
-    m = re.match(r'^([0-9a-f]+)$', s)
-    if m:
-        return link_to_git_commit(m.group(1))
-    m = re.match(r'^rG([0-9a-f]+)$', s)
-    if m:
-        return link_to_git_commit(m.group(1))
-    m = re.match(r'^https://reviews.llvm.org/rG([0-9a-f]+)$', s)
-    if m:
-        return link_to_git_commit(m.group(1))
+    for rx, how in COMMIT_LINK_RXS:
+        m = rx.match(s)
+        if m:
+            return how(m.group(1))
     return s
 
 
-def reformat_timestamp(t):
+def reformat_timestamp_slowly(t):
     # GitHub is very picky about its timestamp formats.
     assert re.match(r'\d\d\d\d-\d\d-\d\d \d\d:\d\d:\d\d [+-]\d\d00', t), 'Unexpected timestamp %s' % t
     t = t[:19] + t[20:]  # remove the space
@@ -230,12 +238,28 @@ def reformat_timestamp(t):
     return result
 
 
-def repeated_element(bz, key):
-    # Handle the fact that xmltodict turns "<a>1</a>" into {"a": "1"},
-    # but "<a>1</a><a>2</a>" becomes {"a": ["1","2"]}.
-    # If x is not list, it might be either str or dict/OrderedDict.
-    x = bz.get(key, [])
-    return x if (type(x) is list) else [x]
+# Bugzilla's timestamps look like "2009-04-15 10:35:02 -0700". Those we can
+# convert with simple arithmetic; anything else goes the long way round,
+# through dateutil, which also does all the error-checking.
+# Many comments share a timestamp, so the results are cached too.
+# See benchmarks/reformat-timestamp.py for a comparison of the two paths.
+BUGZILLA_TIMESTAMP_RX = re.compile(r'([0-9]{4})-([0-9]{2})-([0-9]{2}) ([0-9]{2}):([0-9]{2}):([0-9]{2}) ([+-])([0-9]{2})00')
+TIMESTAMP_CACHE_SIZE = 65536
+
+
+@functools.lru_cache(maxsize=TIMESTAMP_CACHE_SIZE)
+def reformat_timestamp(t):
+    m = BUGZILLA_TIMESTAMP_RX.fullmatch(t)
+    if m is None:
+        return reformat_timestamp_slowly(t)
+    try:
+        dt = datetime.datetime(*[int(g) for g in m.group(1, 2, 3, 4, 5, 6)])
+        offset = datetime.timedelta(hours=int(m.group(8)))
+        dt = (dt - offset) if (m.group(7) == '+') else (dt + offset)
+    except (ValueError, OverflowError):
+        # e.g. "24:00:00", which dateutil accepts and we don't.
+        return reformat_timestamp_slowly(t)
+    return '%04d-%02d-%02dT%02d:%02d:%02dZ' % (dt.year, dt.month, dt.day, dt.hour, dt.minute, dt.second)
 
 
 def parse_bz_status(bz):
@@ -320,12 +344,12 @@ def generate_summary_table(bz):
         bz['delta_ts'],
         bz['version'],
         '%s %s' % (bz['rep_platform'], bz['op_sys']),
-        ', '.join(repeated_element(bz, 'cc')),
+        ', '.join(bzreader.repeated_element(bz, 'cc')),
         fixed_by_commits,
-        '<br/>'.join([to_human_readable_attachment(a) for a in repeated_element(bz, 'attachment')]),
-        ', '.join([link_to_pr_if_possible(s) for s in repeated_element(bz, 'blocked')]),
-        ', '.join([link_to_pr_if_possible(s) for s in repeated_element(bz, 'dependson')]),
-        ', '.join([link_to_pr_if_possible(s) for s in repeated_element(bz, 'see_also')]),
+        '<br/>'.join([to_human_readable_attachment(a) for a in bzreader.repeated_element(bz, 'attachment')]),
+        ', '.join([link_to_pr_if_possible(s) for s in bzreader.repeated_element(bz, 'blocked')]),
+        ', '.join([link_to_pr_if_possible(s) for s in bzreader.repeated_element(bz, 'dependson')]),
+        ', '.join([link_to_pr_if_possible(s) for s in bzreader.repeated_element(bz, 'see_also')]),
     )
 
 
@@ -381,6 +405,48 @@ def to_github_attachment_comment(a):
     }
 
 
+CREATED_ATTACHMENT_RX = re.compile(r'Created attachment ([0-9]+)')
+
+
+def merge_attachment_comments(comments, attachments):
+    # Eliminate boring Bugzilla-generated comments in favor of our custom attachment comments.
+    # This gives exactly the same result as
+    #     for a in attachments:
+    #         boring_body = 'Created attachment %s' % a['attachid']
+    #         comments = [c for c in comments if boring_body not in c['body']]
+    #         comments.append(to_github_attachment_comment(a))
+    #     comments.sort(key=lambda c: c['updated_at'])
+    # (including its quirks: "Created attachment 123" also counts as mentioning
+    # attachment 12, and an attachment comment can itself be eliminated by a
+    # later attachment), but without rescanning every comment per attachment.
+    last_index = {'%s' % a['attachid']: i for i, a in enumerate(attachments)}
+    digit_ids = [attachid for attachid in last_index if re.fullmatch(r'[0-9]+', attachid)]
+    other_ids = [attachid for attachid in last_index if not re.fullmatch(r'[0-9]+', attachid)]
+    longest = max([len(attachid) for attachid in digit_ids], default=0)
+
+    def last_mentioned(body):
+        # The index of the last attachment that would eliminate this body, or -1.
+        result = -1
+        if 'Created attachment ' in body:
+            for m in CREATED_ATTACHMENT_RX.finditer(body):
+                digits = m.group(1)[:longest]
+                for n in range(1, len(digits) + 1):
+                    result = max(result, last_index.get(digits[:n], -1))
+            for attachid in other_ids:
+                if ('Created attachment %s' % attachid) in body:
+                    result = max(result, last_index[attachid])
+        return result
+
+    merged = [c for c in comments if last_mentioned(c['body']) == -1]
+    for i, a in enumerate(attachments):
+        attachment_comment = to_github_attachment_comment(a)
+        if last_mentioned(attachment_comment['body']) <= i:
+            merged.append(attachment_comment)
+    # Both halves are usually already in order, so this is a linear-time merge.
+    merged.sort(key=lambda c: c['updated_at'])
+    return merged
+
+
 def bugzilla_to_github(id, bz):
     # If you did Step 1 without valid Bugzilla credentials, '@exporter' will be missing.
     assert sorted(bz.keys()) == ['bugzilla']
@@ -390,15 +456,10 @@ def bugzilla_to_github(id, bz):
     status = parse_bz_status(bz)
     tags = parse_bz_tags(bz)
 
-    comments = [to_github_comment(c) for c in repeated_element(bz, 'long_desc')[1:]]
-    for a in repeated_element(bz, 'attachment'):
-        # Eliminate boring Bugzilla-generated comments in favor of our custom attachment comments.
-        boring_body = 'Created attachment %s' % a['attachid']
-        attachment_comment = to_github_attachment_comment(a)
-        comments = [
-            c for c in comments if boring_body not in c['body']
-        ] + [attachment_comment]
-    comments.sort(key=lambda c: c['updated_at'])
+    comments = merge_attachment_comments(
+        [to_github_comment(c) for c in bzreader.repeated_element(bz, 'long_desc')[1:]],
+        bzreader.repeated_element(bz, 'attachment'),
+    )
 
     # TODO FIXME BUG HACK: 23 bugs set bz['alias'] to a short human-readable alias,
     # such as "release-13.0.0" (bug 51236) or "poor-debug-experiences" (bug 38768).
@@ -422,35 +483,113 @@ def bugzilla_to_github(id, bz):
             "created_at": reformat_timestamp(bz['creation_ts']),
             "updated_at": reformat_timestamp(bz['delta_ts']),
             "closed_at": None,
-            "body": generate_summary_table(bz) + '\n\n\n' + markdownify(repeated_element(bz, 'long_desc')[0]['thetext'] or ''),
+            "body": generate_summary_table(bz) + '\n\n\n' + markdownify(bzreader.repeated_element(bz, 'long_desc')[0]['thetext'] or ''),
         },
         "comments": comments,
     }
 
 
-def extract_id(fname):
-    m = re.match(r'xml/([0-9]+).xml', fname)
-    assert m, 'Unexpected filename %s in xml/ subdirectory' % fname
-    return int(m.group(1))
+def converter_fingerprint():
+    h = hashlib.sha256()
+    for fname in CONVERTER_SOURCES:
+        with open(fname, 'rb') as f:
+            h.update(f.read())
+    h.update(('dateutil %s' % dateutil.__version__).encode())
+    return h.hexdigest()
+
+
+def load_manifest():
+    manifest = {}
+    if os.path.exists(MANIFEST_FILENAME):
+        with open(MANIFEST_FILENAME) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # The last line may be truncated if we were killed while writing it.
+                    continue
+                manifest[record['id']] = record
+    return manifest
+
+
+def convert_bug(bug, previous, converter):
+    # Returns (status, record), where status is 'hit' if the JSON was
+    # already up to date, 'unchanged' if we reconverted it but got the same
+    # JSON as before (and so didn't rewrite it), or 'converted'.
+    xml_sha256 = bug.sha256()
+    json_fname = 'json/%d.json' % bug.id
+    json_sha256 = corpus.file_sha256(json_fname) if os.path.exists(json_fname) else None
+    if (previous is not None) and (json_sha256 is not None) and (
+        previous['xml_sha256'] == xml_sha256 and
+        previous['converter'] == converter and
+        previous['json_sha256'] == json_sha256
+    ):
+        return 'hit', previous
+    gh = bugzilla_to_github(bug.id, bug.parse())
+    output = json.dumps(gh, indent=2) + '\n'
+    record = {
+        'id': bug.id,
+        'xml_sha256': xml_sha256,
+        'converter': converter,
+        'json_sha256': hashlib.sha256(output.encode()).hexdigest(),
+    }
+    if record['json_sha256'] == json_sha256:
+        return 'unchanged', record
+    with open(json_fname, 'w') as f:
+        f.write(output)
+    return 'converted', record
+
+
+class JsonFileWriter(corpus.Visitor):
+    def __init__(self):
+        self.manifest = load_manifest()
+        self.converter = converter_fingerprint()
+        self.counts = {'hit': 0, 'unchanged': 0, 'converted': 0}
+
+    def start(self):
+        os.makedirs('json', exist_ok=True)
+        self.manifest_file = open(MANIFEST_FILENAME, 'a')
+
+    def visit(self, bug):
+        return convert_bug(bug, self.manifest.get(bug.id), self.converter)
+
+    def collect(self, id, result):
+        status, record = result
+        self.counts[status] += 1
+        if status != 'hit':
+            print(json.dumps(record), file=self.manifest_file)
+            self.manifest[id] = record
+
+    def finish(self):
+        self.manifest_file.close()
+        # Drop the records superseded by the ones appended during this run.
+        with open(MANIFEST_FILENAME + '.tmp', 'w') as f:
+            for id, record in sorted(self.manifest.items()):
+                print(json.dumps(record), file=f)
+        os.replace(MANIFEST_FILENAME + '.tmp', MANIFEST_FILENAME)
+        print('%d bugs were already up to date; converted %d (%d of which came out unchanged and were not rewritten)' % (
+            self.counts['hit'], self.counts['unchanged'] + self.counts['converted'], self.counts['unchanged'],
+        ))
+
+
+class ShardFileWriter(corpus.Visitor):
+    def start(self):
+        self.writer = jsonshards.ShardWriter(SHARD_MAX_BYTES, COMPRESS_SHARDS)
+
+    def visit(self, bug):
+        return jsonshards.encode_record(bugzilla_to_github(bug.id, bug.parse()), COMPRESS_SHARDS)
+
+    def collect(self, id, record):
+        # Bugs are collected in order, so each shard holds a contiguous range of bugs.
+        self.writer.write(id, record)
+
+    def finish(self):
+        self.writer.close()
+        print('Wrote %d bugs into %d shards in %s/' % (len(self.writer.index), len(self.writer.shard_names), jsonshards.SHARDS_DIRECTORY))
 
 
 if __name__ == '__main__':
-    os.makedirs('json', exist_ok=True)
-    all_xml_filenames = glob.glob('xml/*.xml')
-    all_bugzilla_ids = sorted([extract_id(fname) for fname in all_xml_filenames])
-    start_time = time.time()
-    processed = 0
-    for id in all_bugzilla_ids:
-        print('Parsing %d.xml' % id)
-        with open('xml/%d.xml' % id) as f:
-            xml = f.read()
-        xml = xml.replace('\0', '')  # e.g. bug 26078
-        bz = xmltodict.parse(xml)
-        gh = bugzilla_to_github(id, bz)
-        with open('json/%d.json' % id, 'w') as f:
-            print(json.dumps(gh, indent=2), file=f)
-        processed += 1
-        if processed % 100 == 0:
-            elapsed = time.time() - start_time
-            remaining = elapsed * (len(all_bugzilla_ids) - processed) / processed
-            print('Processed %d bugs in %.2fs; %ds remaining' % (processed, elapsed, remaining))
+    visitors = [ShardFileWriter() if WRITE_NDJSON_SHARDS else JsonFileWriter()]
+    if ALSO_UPDATE_SQLITE_INDEX:
+        visitors.append(importlib.import_module('xml-to-sqlite').Indexer())
+    corpus.walk(visitors, jobs=JOBS, chunksize=BUGS_PER_TASK)
@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+
+import bzreader
+import corpus
+import sqlite3
+import time
+
+# This script loads the metadata and comments of every bug in xml/
+# into an SQLite database, so that questions like "which bugs are CONFIRMED?"
+# can be answered in milliseconds instead of by re-parsing 51567 XML files.
+# Rerunning it updates only the bugs whose XML files have changed
+# (and forgets those whose XML files are gone).
+#
+# Comment text is full-text searchable, e.g.
+#     sqlite3 bugs.sqlite "SELECT bug_id, comment_count FROM comments
+#         WHERE id IN (SELECT rowid FROM comments_fts WHERE comments_fts MATCH 'miscompile')"
+
+DATABASE_FILENAME = 'bugs.sqlite'
+BUGS_PER_TRANSACTION = 1000
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS bugs (
+        id INTEGER PRIMARY KEY,
+        xml_sha256 TEXT NOT NULL,
+        short_desc TEXT,
+        product TEXT,
+        component TEXT,
+        version TEXT,
+        status TEXT,
+        resolution TEXT,
+        dup_id INTEGER,
+        everconfirmed TEXT,
+        keywords TEXT,
+        priority TEXT,
+        severity TEXT,
+        reporter TEXT,
+        assigned_to TEXT,
+        creation_ts TEXT,
+        delta_ts TEXT
+    );
+    CREATE INDEX IF NOT EXISTS bugs_by_status ON bugs (status, resolution);
+
+    -- kind is 'blocked', 'dependson', or 'see_also'. target is a bug number
+    -- for the first two, and usually a URL for see_also.
+    CREATE TABLE IF NOT EXISTS relations (
+        bug_id INTEGER NOT NULL,
+        kind TEXT NOT NULL,
+        target TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS relations_by_bug ON relations (bug_id);
+    CREATE INDEX IF NOT EXISTS relations_by_target ON relations (target, kind);
+
+    -- comment_count 0 is the bug's description.
+    CREATE TABLE IF NOT EXISTS comments (
+        id INTEGER PRIMARY KEY,
+        bug_id INTEGER NOT NULL,
+        comment_count INTEGER,
+        who TEXT,
+        bug_when TEXT,
+        thetext TEXT
+    );
+    CREATE INDEX IF NOT EXISTS comments_by_bug ON comments (bug_id);
+
+    -- The full-text index of comments.thetext, kept in sync by the triggers below.
+    CREATE VIRTUAL TABLE IF NOT EXISTS comments_fts USING fts5 (
+        thetext, content='comments', content_rowid='id'
+    );
+    CREATE TRIGGER IF NOT EXISTS comments_ai AFTER INSERT ON comments BEGIN
+        INSERT INTO comments_fts (rowid, thetext) VALUES (new.id, new.thetext);
+    END;
+    CREATE TRIGGER IF NOT EXISTS comments_ad AFTER DELETE ON comments BEGIN
+        INSERT INTO comments_fts (comments_fts, rowid, thetext) VALUES ('delete', old.id, old.thetext);
+    END;
+'''
+
+
+def to_login(bz_userblob):
+    if (bz_userblob is None) or (type(bz_userblob) is str):
+        return bz_userblob
+    return bz_userblob['#text']
+
+
+def delete_bug(db, id):
+    db.execute('DELETE FROM bugs WHERE id = ?', (id,))
+    db.execute('DELETE FROM relations WHERE bug_id = ?', (id,))
+    db.execute('DELETE FROM comments WHERE bug_id = ?', (id,))
+
+
+def bug_to_rows(bug, xml_sha256):
+    assert bug['bug_id'] == str(bug.id)
+    id = bug.id
+    bug_row = (
+        id, xml_sha256, bug.get('short_desc'),
+        bug.get('product'), bug.get('component'), bug.get('version'),
+        bug.get('bug_status'), bug.get('resolution'),
+        int(bug['dup_id']) if bug.get('dup_id') else None,
+        bug.get('everconfirmed'), bug.get('keywords'),
+        bug.get('priority'), bug.get('bug_severity'),
+        to_login(bug.get('reporter')), to_login(bug.get('assigned_to')),
+        bug.get('creation_ts'), bug.get('delta_ts'),
+    )
+    relation_rows = [
+        (id, kind, target)
+        for kind in ['blocked', 'dependson', 'see_also']
+        for target in bzreader.repeated_element(bug, kind) if target is not None
+    ]
+    comment_rows = [
+        (id, int(c['comment_count']), to_login(c.get('who')), c.get('bug_when'), c.get('thetext') or '')
+        for c in bzreader.repeated_element(bug, 'long_desc')
+    ]
+    return bug_row, relation_rows, comment_rows
+
+
+class Indexer(corpus.Visitor):
+    fields = frozenset([
+        'bug_id', 'short_desc', 'product', 'component', 'version',
+        'bug_status', 'resolution', 'dup_id', 'everconfirmed', 'keywords',
+        'priority', 'bug_severity', 'reporter', 'assigned_to', 'creation_ts', 'delta_ts',
+        'blocked', 'dependson', 'see_also', 'long_desc',
+    ])
+
+    def __init__(self):
+        db = sqlite3.connect(DATABASE_FILENAME)
+        db.executescript(SCHEMA)
+        self.indexed = dict(db.execute('SELECT id, xml_sha256 FROM bugs'))
+        db.close()
+        self.seen = set()
+        self.updated = 0
+        self.up_to_date = 0
+        self.invalidated = 0
+        self.start_time = time.time()
+
+    def start(self):
+        self.db = sqlite3.connect(DATABASE_FILENAME)
+
+    def visit(self, bug):
+        xml_sha256 = bug.sha256()
+        if self.indexed.get(bug.id) == xml_sha256:
+            return None
+        if '@error' in bug.parse()['bugzilla']['bug']:
+            print('Skipping %s: %s' % (bug.fname, bug.parse()['bugzilla']['bug']['@error']))
+            return 'error'
+        return bug_to_rows(bug, xml_sha256)
+
+    def collect(self, id, result):
+        self.seen.add(id)
+        if result is None:
+            self.up_to_date += 1
+        elif result == 'error':
+            # It may have been a real bug the last time we indexed it.
+            if id in self.indexed:
+                delete_bug(self.db, id)
+                self.invalidated += 1
+        else:
+            bug_row, relation_rows, comment_rows = result
+            delete_bug(self.db, id)
+            self.db.execute('INSERT INTO bugs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', bug_row)
+            self.db.executemany('INSERT INTO relations VALUES (?, ?, ?)', relation_rows)
+            self.db.executemany('INSERT INTO comments (bug_id, comment_count, who, bug_when, thetext) VALUES (?, ?, ?, ?, ?)', comment_rows)
+            self.updated += 1
+            if self.updated % BUGS_PER_TRANSACTION == 0:
+                self.db.commit()
+
+    def finish(self):
+        removed = sorted(set(self.indexed.keys()) - self.seen)
+        for id in removed:
+            delete_bug(self.db, id)
+        self.db.commit()
+        self.db.close()
+        print('Indexed %d new or changed bugs, and removed %d, in %.2fs; %d bugs were already up to date' % (
+            self.updated, len(removed) + self.invalidated, time.time() - self.start_time, self.up_to_date,
+        ))
+
+
+if __name__ == '__main__':
+    corpus.walk([Indexer()])